@@ -0,0 +1,195 @@
+import os
+import copy
+import zipfile
+import logging
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+FT_NAMESPACE = 'http://ref.fluidtopics.com/v3/ft#'
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+NODE = f'{{{FT_NAMESPACE}}}node'
+TITLE = f'{{{FT_NAMESPACE}}}title'
+ORIGIN_ID = f'{{{FT_NAMESPACE}}}originID'
+
+ET.register_namespace('ft', FT_NAMESPACE)
+ET.register_namespace('xsi', XSI_NAMESPACE)
+
+
+class ArchiveLimitError(ValueError):
+    pass
+
+
+def node_page(node):
+    href = node.get('href')
+    return href.split('#', 1)[0] if href else None
+
+
+def subtree_pages(node):
+    return [page for page in (node_page(n) for n in node.iter(NODE)) if page]
+
+
+class ArchiveSplitter:
+    """
+    Splits a converted publication into ZIP archives whose content stays under
+    max_bytes (uncompressed, so the archives are always smaller).
+
+    Parts are cut along the FTMAP: whole top-level branches when they fit, otherwise
+    a branch's page and each of its child branches separately. Branches whose pages
+    link to each other stay in the same part, so that no link crosses from one part
+    to another; when such a group, or a single page with the files it links to, does
+    not fit in max_bytes, planning fails with ArchiveLimitError rather than write an
+    archive over the limit. Each part carries the pages of its branches,
+    the files those pages link to (from the link index) and a SUMMARY.ftmap pruned to
+    its branches, under an originID of its own: every part is a publication of its
+    own. Files no page links to are packed after the branches.
+    """
+
+    def __init__(self, folder_path, link_index, max_bytes):
+        self.folder_path = folder_path
+        self.link_index = link_index
+        self.max_bytes = max_bytes
+
+    def size(self, path):
+        return os.path.getsize(os.path.join(self.folder_path, path))
+
+    def unit_files(self, pages):
+        files = set()
+        for page in pages:
+            if os.path.isfile(os.path.join(self.folder_path, page)):
+                files.add(page)
+                files.update(self.link_index.local_files(page))
+        return files
+
+    def units(self, nodes):
+        """
+        Yields (pages, files) groups small enough to fit a part, in TOC order.
+        """
+        for node in nodes:
+            pages = subtree_pages(node)
+            files = self.unit_files(pages)
+            children = node.findall(NODE)
+            if sum(self.size(f) for f in files) <= self.max_bytes or not children:
+                yield pages, files
+                continue
+            own_page = [node_page(node)] if node_page(node) else []
+            if own_page:
+                yield own_page, self.unit_files(own_page)
+            yield from self.units(children)
+
+    def linked_pages(self, page):
+        targets = (self.link_index.target(page, url)[0] for url in self.link_index.links.get(page, ()))
+        return {target for target in targets if target in self.link_index.pages and target != page}
+
+    def join_linked(self, groups):
+        """
+        Merges the (pages, files) groups whose pages link to each other, keeping the
+        order in which each merged group first appears.
+        """
+        owner = {}
+        for index, (pages, files) in enumerate(groups):
+            for page in [*pages, *files]:
+                if page in self.link_index.pages:
+                    owner.setdefault(page, index)
+        parents = list(range(len(groups)))
+
+        def find(index):
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+
+        for page, index in owner.items():
+            for target in self.linked_pages(page):
+                if target in owner:
+                    first, second = sorted((find(index), find(owner[target])))
+                    parents[second] = first
+
+        merged = {}
+        for index, (pages, files) in enumerate(groups):
+            merged_pages, merged_files = merged.setdefault(find(index), ([], set()))
+            merged_pages.extend(pages)
+            merged_files.update(files)
+        return list(merged.values())
+
+    def plan(self, ftmap_root, other_files):
+        """
+        Returns the parts as lists of (pages, files), packing units in order and
+        starting a new part when the next unit does not fit. Raises ArchiveLimitError
+        when a unit alone exceeds max_bytes.
+        """
+        toc = ftmap_root.find(f'{{{FT_NAMESPACE}}}toc')
+        groups = list(self.units(toc.findall(NODE) if toc is not None else []))
+        packed = set()
+        for _, files in groups:
+            packed.update(files)
+        groups.extend(([], {path}) for path in other_files if path not in packed)
+        groups = self.join_linked(groups)
+
+        parts = []
+        current_pages, current_files, current_bytes = [], set(), 0
+        for pages, files in groups:
+            new_files = files - current_files
+            unit_bytes = sum(self.size(f) for f in new_files)
+            if current_files and current_bytes + unit_bytes > self.max_bytes:
+                parts.append((current_pages, current_files))
+                current_pages, current_files, current_bytes = [], set(), 0
+                new_files, unit_bytes = files, sum(self.size(f) for f in files)
+            if unit_bytes > self.max_bytes:
+                raise ArchiveLimitError(
+                    f"{len(pages)} pages that link to each other, starting with {min(pages or files)}, take "
+                    f"{unit_bytes / 2**20:.2f} MB with the files they link to, over the "
+                    f"{self.max_bytes / 2**20:g} MB archive limit. They cannot be split without breaking links: "
+                    f"raise ARCHIVE_MAX_MB, or unset it to upload a single archive")
+            current_pages.extend(pages)
+            current_files.update(new_files)
+            current_bytes += unit_bytes
+        if current_files:
+            parts.append((current_pages, current_files))
+        return parts
+
+    def part_ftmap(self, ftmap_root, pages, index, count):
+        """
+        Copies the FTMAP keeping only the nodes of pages, plus their ancestors without
+        a link, so that each part is a publication of its own.
+        """
+        root = copy.deepcopy(ftmap_root)
+        pages = set(pages)
+
+        def prune(parent):
+            for node in list(parent.findall(NODE)):
+                prune(node)
+                if node_page(node) not in pages:
+                    node.attrib.pop('href', None)
+                    if not node.findall(NODE):
+                        parent.remove(node)
+
+        toc = root.find(f'{{{FT_NAMESPACE}}}toc')
+        if toc is not None:
+            prune(toc)
+        root.set(TITLE, f"{root.get(TITLE)} ({index} of {count})")
+        root.set(ORIGIN_ID, f"{root.get(ORIGIN_ID, '0')}-part{index}")
+        return ET.tostring(root, encoding='unicode')
+
+    def write(self, ftmap_path, other_files, archive_base, extra_files=()):
+        """
+        Writes <archive_base>.partNNN.zip files and returns their paths. extra_files
+        (such as SUMMARY.html) go into the first part.
+        """
+        ftmap_root = ET.parse(ftmap_path).getroot()
+        ftmap_name = os.path.relpath(ftmap_path, self.folder_path)
+        parts = self.plan(ftmap_root, other_files)
+        archives = []
+        for index, (pages, files) in enumerate(parts, start=1):
+            archive_path = f"{archive_base}.part{index:03d}.zip"
+            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for path in sorted(files):
+                    archive.write(os.path.join(self.folder_path, path), path)
+                if index == 1:
+                    for path in extra_files:
+                        archive.write(os.path.join(self.folder_path, path), path)
+                archive.writestr(ftmap_name, self.part_ftmap(ftmap_root, pages, index, len(parts)))
+            archives.append(archive_path)
+        logger.info(f"Split the publication into {len(archives)} archives of at most "
+                    f"{self.max_bytes / 2**20:g} MB of content")
+        return archives
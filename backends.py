@@ -0,0 +1,206 @@
+import os
+import sys
+import shutil
+import logging
+import zipfile
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from html_converter import HTMLConverter
+from ftmap_generator import FTMapGenerator
+from includes import MarkdownIncludeCache, include_targets
+from reachability import excluded_report, reachable_files
+
+logger = logging.getLogger(__name__)
+
+TOOLS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# md2ft and md2ftml are script folders whose modules import their siblings by bare name.
+# Registering them here, rather than on first use, lets every worker process unpickle
+# results and exceptions raised by those modules.
+for tool in ('md2ft', 'md2ftml'):
+    tool_path = os.path.join(TOOLS_FOLDER, tool)
+    if tool_path not in sys.path:
+        sys.path.append(tool_path)
+
+
+def import_tool_module(module):
+    return importlib.import_module(module)
+
+
+# The Markdown backends expand includes before their tools see the page; one cache
+# per worker process
+markdown_includes = MarkdownIncludeCache()
+
+
+class ConverterBackend:
+    """
+    A Markdown-to-Fluid-Topics conversion backend.
+
+    A backend only knows how to convert a single page and how to build the TOC of a
+    converted folder; discovery, asset staging, parallelism and packaging are shared
+    by every backend through run_backend.
+    """
+    name = None
+    output_suffix = '.md'
+
+    def convert_page(self, markdown_text, source_path):
+        raise NotImplementedError
+
+    def build_toc(self, source_folder, output_folder, title):
+        raise NotImplementedError
+
+
+class HTMLConverterBackend(ConverterBackend):
+    name = 'html'
+    output_suffix = '.html'
+
+    def __init__(self, minify=False):
+        self.converter = HTMLConverter(None, minify)
+
+    def convert_page(self, markdown_text, source_path):
+        return self.converter.manipulate_html(self.converter.render_markdown(markdown_text, source_path))
+
+    def build_toc(self, source_folder, output_folder, title):
+        FTMapGenerator(output_folder, title=title).generate()
+        return os.path.join(output_folder, 'SUMMARY.ftmap')
+
+
+class Md2ftBackend(ConverterBackend):
+    name = 'md2ft'
+
+    def convert_page(self, markdown_text, source_path):
+        converter = import_tool_module('converter')
+        content = converter.convert_headers_to_inline_styles(markdown_includes.expand(markdown_text, source_path))
+        return converter.convert_gitbook_to_standard_markdown_newline(content)
+
+    def build_toc(self, source_folder, output_folder, title):
+        converter = import_tool_module('converter')
+        toc_path = converter.generate_toc_yaml(output_folder, os.path.join(source_folder, 'SUMMARY.md'), title)
+        converter.fix_relative_images_in_markdown(output_folder)
+        return toc_path
+
+
+class PandocBackend(ConverterBackend):
+    name = 'md2ftml'
+
+    def convert_page(self, markdown_text, source_path):
+        conv = import_tool_module('conv')
+        markdown_text = markdown_includes.expand(markdown_text, source_path)
+        return conv.adjust_markdown_syntax(conv.run_pandoc(markdown_text, source_path))
+
+    def build_toc(self, source_folder, output_folder, title):
+        summary = import_tool_module('summary')
+        summary.create_summary(source_folder, output_folder, title)
+        return os.path.join(output_folder, 'Summary.ftmap')
+
+
+BACKENDS = {backend.name: backend for backend in (HTMLConverterBackend, Md2ftBackend, PandocBackend)}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def discover_pages(source_folder):
+    """
+    Returns the Markdown pages of a GitBook folder as sorted relative paths,
+    skipping hidden folders such as .git and .gitbook and the files pages include.
+    """
+    md_paths = []
+    for root, dirs, files in os.walk(source_folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        md_paths.extend(os.path.join(root, file) for file in files if file.endswith('.md'))
+    snippets = include_targets(md_paths)
+    return sorted(os.path.relpath(md_path, source_folder) for md_path in md_paths
+                  if os.path.realpath(md_path) not in snippets)
+
+
+def stage_assets(source_folder, output_folder):
+    # Everything that is not a page (images, .gitbook assets, ...) goes into the archive as is
+    shutil.copytree(source_folder, output_folder, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns('*.md', '.git'))
+
+
+def convert_page_file(backend, source_folder, output_folder, relative_path):
+    source_path = os.path.join(source_folder, relative_path)
+    with open(source_path, 'r', encoding='utf-8') as file:
+        markdown_text = file.read()
+    content = backend.convert_page(markdown_text, source_path)
+    output_path = os.path.join(output_folder, os.path.splitext(relative_path)[0] + backend.output_suffix)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    return output_path
+
+
+def convert_pages(backend, source_folder, output_folder, pages, workers=None, executor=None):
+    """
+    Converts pages in a process pool: the given executor if any (e.g. a pool of warm
+    workers kept by a long-running service), otherwise a new one.
+    """
+    if workers == 1 and executor is None:
+        return [convert_page_file(backend, source_folder, output_folder, page) for page in pages]
+    count = len(pages)
+    args = ([backend] * count, [source_folder] * count, [output_folder] * count, pages)
+    chunksize = max(1, count // 64)
+    if executor is not None:
+        return list(executor.map(convert_page_file, *args, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(convert_page_file, *args, chunksize=chunksize))
+
+
+def package(output_folder, archive_path, toc_path=None):
+    """
+    Zips output_folder, or only what the TOC at toc_path reaches through page links
+    and images. Returns the archive path and the (name, size) pairs left out.
+    """
+    archive_path = os.path.abspath(archive_path)
+    excluded = []
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        if toc_path:
+            toc_name = os.path.relpath(toc_path, output_folder).replace(os.sep, '/')
+            entries, excluded = reachable_files([('', output_folder)], toc_name, exclude=[archive_path])
+            for name, path in entries:
+                archive.write(path, name)
+        else:
+            for root, _, files in os.walk(output_folder):
+                for file in sorted(files):
+                    path = os.path.join(root, file)
+                    if os.path.abspath(path) != archive_path:
+                        archive.write(path, os.path.relpath(path, output_folder))
+    for line in excluded_report(excluded) if excluded else ():
+        logger.info(line)
+    return archive_path, excluded
+
+
+def run_backend(backend, source_folder, output_folder, title, archive_path=None, workers=None, executor=None,
+                prune=True):
+    """
+    Converts source_folder into output_folder with the given backend, builds its TOC
+    and packages the result: what the TOC reaches when prune is set, otherwise every
+    output file.
+
+    Returns:
+        dict: Number of pages, TOC path, archive path and size in bytes, and the
+            number and size of the files left out.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    pages = discover_pages(source_folder)
+    stage_assets(source_folder, output_folder)
+
+    logger.info(f"Converting {len(pages)} pages with the {backend.name} backend")
+    convert_pages(backend, source_folder, output_folder, pages, workers, executor)
+    toc_path = backend.build_toc(source_folder, output_folder, title)
+
+    archive_path, excluded = package(output_folder, archive_path or f"{output_folder.rstrip(os.sep)}.zip",
+                                     toc_path if prune else None)
+    return {
+        'pages': len(pages),
+        'toc': toc_path,
+        'archive': archive_path,
+        'archive_bytes': os.path.getsize(archive_path),
+        'excluded_files': len(excluded),
+        'excluded_bytes': sum(size for _, size in excluded),
+    }
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from backends import BACKENDS, get_backend, run_backend
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux; worker processes are accounted as children
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * 1024
+
+
+def benchmark_backend(name, corpus, title, workers, connection):
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"ft_bench_{name}_") as work_dir:
+            output_folder = os.path.join(work_dir, 'output')
+            start = time.perf_counter()
+            result = run_backend(get_backend(name), corpus, output_folder, title,
+                                 archive_path=os.path.join(work_dir, 'archive.zip'), workers=workers)
+            seconds = time.perf_counter() - start
+        connection.send({
+            'backend': name,
+            'pages': result['pages'],
+            'seconds': round(seconds, 3),
+            'pages_per_second': round(result['pages'] / seconds, 2) if seconds else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'archive_bytes': result['archive_bytes'],
+        })
+    except Exception as e:
+        connection.send({'backend': name, 'error': str(e)})
+
+
+def run_benchmark(corpus, title, backends, workers=None):
+    """
+    Runs every backend on the same corpus, each in a fresh process so that peak RSS
+    is measured per backend.
+    """
+    results = []
+    for name in backends:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=benchmark_backend, args=(name, corpus, title, workers, sender))
+        process.start()
+        # Only the child holds the sending end, so recv() fails instead of blocking if
+        # it dies without sending, e.g. when it is killed for running out of memory
+        sender.close()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            process.join()
+            result = {'backend': name, 'error': f"process exited with code {process.exitcode} without a result"}
+        receiver.close()
+        process.join()
+        if 'error' in result:
+            logger.error(f"{name} backend failed: {result['error']}")
+        results.append(result)
+    return results
+
+
+def print_results(results):
+    print(f"{'backend':<10} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'peak RSS MB':>12} {'archive KB':>11}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['backend']:<10} failed: {result['error']}")
+            continue
+        print(f"{result['backend']:<10} {result['pages']:>7} {result['seconds']:>9.2f} "
+              f"{result['pages_per_second']:>9.1f} {result['peak_rss_bytes'] / 2**20:>12.1f} "
+              f"{result['archive_bytes'] / 1024:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the conversion backends on the same GitBook corpus.")
+    parser.add_argument('corpus', help="GitBook folder containing SUMMARY.md")
+    parser.add_argument('--title', default='Benchmark', help="Publication title used for the TOC")
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--workers', type=int, default=None, help="Conversion processes (default: one per core)")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.corpus, args.title, args.backends, args.workers)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if any('error' in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
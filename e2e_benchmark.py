@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+DEFAULT_BASELINE = 'e2e_baseline.json'
+PAGES_PER_SECTION = 50
+IMAGES = 5
+# A small valid PNG, so that the assets are real files of a realistic kind
+PNG_BYTES = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082')
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def page_markdown(rng, title, next_link):
+    words = ['artifact', 'repository', 'build', 'release', 'permission', 'token', 'replication', 'index']
+    paragraph = lambda: ' '.join(rng.choice(words) for _ in range(60)) + '.'
+    return f"""# {title}
+
+{paragraph()}
+
+## Overview
+
+{paragraph()}
+
+![Diagram](../.gitbook/assets/image-{rng.randrange(IMAGES)}.png)
+
+{{% hint style="info" %}}
+{paragraph()}
+{{% endhint %}}
+
+| Setting | Value | Description |
+|---------|-------|-------------|
+| `timeout` | {rng.randrange(1000)} | {paragraph()[:80]} |
+| `retries` | {rng.randrange(10)} | {paragraph()[:80]} |
+
+```bash
+curl -X GET "https://example.com/api/{rng.randrange(1000)}"
+```
+
+## Details
+
+{paragraph()} See [the next page]({next_link}#details).
+"""
+
+
+def generate_corpus(folder, pages, seed=0):
+    """
+    Writes a synthetic GitBook space of `pages` pages: sections of
+    PAGES_PER_SECTION pages with a README each, shared images, and valid links
+    between pages.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(folder, '.gitbook', 'assets'))
+    for index in range(IMAGES):
+        with open(os.path.join(folder, '.gitbook', 'assets', f"image-{index}.png"), 'wb') as file:
+            file.write(PNG_BYTES)
+
+    summary = ["# Table of contents", "", "* [Introduction](README.md)"]
+    with open(os.path.join(folder, 'README.md'), 'w', encoding='utf-8') as file:
+        file.write(page_markdown(rng, "Introduction", "section-0/README.md").replace('../.gitbook', '.gitbook'))
+
+    # The introduction is one of the pages
+    remaining = pages - 1
+    section = 0
+    while remaining > 0:
+        section_folder = os.path.join(folder, f"section-{section}")
+        os.makedirs(section_folder)
+        section_pages = min(PAGES_PER_SECTION, remaining)
+        summary.append(f"* [Section {section}](section-{section}/README.md)")
+        for page in range(section_pages):
+            name = 'README.md' if page == 0 else f"page-{page}.md"
+            next_name = f"page-{page + 1}.md" if page + 1 < section_pages else 'README.md'
+            title = f"Section {section}" if page == 0 else f"Section {section} page {page}"
+            with open(os.path.join(section_folder, name), 'w', encoding='utf-8') as file:
+                file.write(page_markdown(rng, title, next_name))
+            if page:
+                summary.append(f"  * [{title}](section-{section}/{name})")
+        remaining -= section_pages
+        section += 1
+
+    with open(os.path.join(folder, 'SUMMARY.md'), 'w', encoding='utf-8') as file:
+        file.write("\n".join(summary) + "\n")
+    return folder
+
+
+class UploadSink(BaseHTTPRequestHandler):
+    """
+    Stands in for the Fluid Topics upload endpoint: reads and discards the body.
+    """
+    received_bytes = 0
+    uploads = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            with UploadSink.lock:
+                UploadSink.received_bytes += len(chunk)
+        with UploadSink.lock:
+            UploadSink.uploads += 1
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_main(corpus, work_dir, sink_url):
+    """
+    Runs main.py on a copy of the corpus (main.py converts in place) and returns its
+    wall time, peak RSS and run metrics.
+    """
+    repo_folder = os.path.join(work_dir, 'space')
+    shutil.copytree(corpus, repo_folder)
+    env = dict(os.environ,
+               GITBOOK_REPO_FOLDER=repo_folder,
+               FLUID_TOPICS_API_KEY='benchmark',
+               FLUID_TOPICS_BASE_URL=sink_url,
+               FLUID_TOPICS_SOURCE_ID='benchmark',
+               PUBLICATION_TITLE='Benchmark',
+               METRICS_FILE=os.path.join(work_dir, 'run_metrics'),
+               LINK_REPORT=os.path.join(work_dir, 'link_report.json'))
+
+    start = time.perf_counter()
+    with open(os.path.join(work_dir, 'main.log'), 'w') as log:
+        process = subprocess.Popen([sys.executable, MAIN_SCRIPT], cwd=work_dir, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        # wait4's usage covers main.py and the worker processes it waited for
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"main.py exited with {process.returncode}, see {log.name}")
+
+    with open(os.path.join(work_dir, 'run_metrics.json'), 'r', encoding='utf-8') as file:
+        metrics = json.load(file)
+    return seconds, usage.ru_maxrss * 1024, metrics
+
+
+def benchmark_size(pages, sink_url, keep=False):
+    work_dir = tempfile.mkdtemp(prefix=f"ft_e2e_{pages}_")
+    try:
+        corpus = generate_corpus(os.path.join(work_dir, 'corpus'), pages)
+        uploaded_before = UploadSink.received_bytes
+        seconds, peak_rss, metrics = run_main(corpus, work_dir, sink_url)
+        return {
+            'pages': pages,
+            'seconds': round(seconds, 3),
+            'pages_per_second': round(pages / seconds, 2),
+            'peak_rss_bytes': peak_rss,
+            'archive_bytes': metrics.get('archive_bytes'),
+            'uploaded_bytes': UploadSink.received_bytes - uploaded_before,
+            'stage_seconds': metrics.get('stage_duration_seconds', {}),
+        }
+    finally:
+        if keep:
+            logger.info(f"Kept the {pages}-page run in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the sizes whose wall time grew by more than `threshold` (a fraction)
+    compared to the baseline, with their slowdown.
+    """
+    regressions = []
+    for size, result in results.items():
+        reference = baseline.get(size)
+        if not reference:
+            continue
+        slowdown = result['seconds'] / reference['seconds'] - 1
+        result['slowdown'] = round(slowdown, 3)
+        if slowdown > threshold:
+            regressions.append((size, slowdown))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'pages':>7} {'seconds':>9} {'pages/s':>9} {'peak RSS MB':>12} {'archive MB':>11} {'vs baseline':>12}")
+    for size, result in results.items():
+        slowdown = f"{result['slowdown']:+.1%}" if 'slowdown' in result else '-'
+        print(f"{size:>7} {result['seconds']:>9.2f} {result['pages_per_second']:>9.1f} "
+              f"{result['peak_rss_bytes'] / 2**20:>12.1f} {result['archive_bytes'] / 2**20:>11.2f} {slowdown:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the whole main.py flow on synthetic corpora and compare against a baseline.")
+    parser.add_argument('--pages', type=int, nargs='+', default=DEFAULT_SIZES, help="Corpus sizes to run")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Store these results as the new baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Fail when a size is slower than the baseline by more than this fraction")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="Keep the corpora and outputs for inspection")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UploadSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sink_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # JSON object keys are strings, so sizes are keyed as strings throughout
+    results = {}
+    try:
+        for pages in sorted(args.pages):
+            logger.info(f"Running the full flow on {pages} pages")
+            results[str(pages)] = benchmark_size(pages, sink_url, keep=args.keep)
+    finally:
+        server.shutdown()
+
+    regressions = []
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        logger.info(f"Baseline written to {args.baseline}")
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    for size, slowdown in regressions:
+        logger.error(f"{size} pages: {slowdown:.1%} slower than the baseline (threshold {args.threshold:.0%})")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
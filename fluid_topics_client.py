@@ -1,8 +1,30 @@
+import os
+import time
 import requests
 import logging
+from urllib3.exceptions import ConnectTimeoutError
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+# Seconds before the first retry of a failed upload; doubles with every retry
+RETRY_DELAY = 2
+# Responses after which the archive was certainly not accepted and may be sent again
+RETRY_STATUSES = frozenset((408, 429))
+# Seconds to wait for the connection, and between bytes of the response
+CONNECT_TIMEOUT = 10
+
+
+def never_sent(error):
+    """
+    Whether a ConnectionError happened before any byte of the request was sent. Only
+    then is the archive certainly not accepted.
+    """
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectTimeout) or isinstance(reason, ConnectTimeoutError)
+
+
 class BearerAuth(requests.auth.AuthBase):
     def __init__(self, token):
         self.token = token
@@ -16,21 +38,74 @@ class FluidTopicsClient:
         self.api_key = config['api_key']
         self.base_url = config['base_url']
         self.source_id = config['source_id']
+        self.max_retries = config.get('upload_retries', 0)
+        self.connections = config.get('upload_connections', 1)
+        self.timeout = (CONNECT_TIMEOUT, config.get('upload_timeout', 600))
+        self.retries = 0
+        self.uploaded_bytes = 0
+        self.upload_seconds = 0.0
+        self.lock = threading.Lock()
 
     def upload(self, zip_file):
+        start = time.perf_counter()
+        uploaded = self._upload_with_retries(zip_file)
+        with self.lock:
+            self.upload_seconds += time.perf_counter() - start
+        return uploaded
+
+    def upload_parts(self, zip_files):
+        """
+        Uploads several archives over at most `connections` concurrent connections,
+        retrying each archive on its own. Returns True if every archive was uploaded.
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            results = list(executor.map(self._upload_with_retries, zip_files))
+        with self.lock:
+            self.upload_seconds += time.perf_counter() - start
+        return all(results)
+
+    def _upload_with_retries(self, zip_file):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self.lock:
+                    self.retries += 1
+                logger.warning(f'Retrying upload of {zip_file} ({attempt}/{self.max_retries})')
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            uploaded, retryable = self._send(zip_file)
+            if uploaded:
+                with self.lock:
+                    self.uploaded_bytes += os.path.getsize(zip_file)
+                return True
+            if not retryable:
+                break
+        return False
+
+    def _send(self, zip_file):
+        """
+        Sends the archive once. Returns (uploaded, retryable): a failure is retryable
+        only when the archive was certainly not accepted, so that it is never
+        published twice.
+        """
         logger.info(f'Started uploading {zip_file} to Fluid Topics')
         with open(zip_file, "rb") as file:
             files = {"file": file}
             url = f"{self.base_url}/api/admin/khub/sources/{self.source_id}/upload"
             try:
-                r = requests.post(url, files=files, auth=BearerAuth(self.api_key))
+                r = requests.post(url, files=files, auth=BearerAuth(self.api_key), timeout=self.timeout)
                 if not r.ok:
                     logger.error("Failed to upload the data to Fluid Topics.")
                     logger.error(f"Response Code: {r.status_code}")
                     logger.error(f"Response Content: {r.content}")
-                    return False
-            except requests.exceptions.ConnectionError:
+                    return False, r.status_code in RETRY_STATUSES or r.status_code >= 500
+            except requests.exceptions.ConnectionError as e:
+                if never_sent(e):
+                    logger.error(f'Could not connect to {url}: {e}')
+                    return False, True
                 logger.error(f'Connection reset while sending archive to {url}, please check that file uploaded correctly')
-                return False
+                return False, False
+            except requests.exceptions.Timeout:
+                logger.error(f'No response from {url} within {self.timeout[1]}s, please check that file uploaded correctly')
+                return False, False
         logger.info(f'Finished uploading {zip_file} to Fluid Topics')
-        return True
\ No newline at end of file
+        return True, False
@@ -0,0 +1,137 @@
+import re
+import html
+import posixpath
+from includes import include_path
+
+# One line holding a single GitBook tag, e.g. {% hint style="info" %} or {% endtabs %}
+TAG_PATTERN = r'^ {0,3}\{%[ \t]*(?P<gitbook_tag_body>[^\n]*?)[ \t]*%\}[ \t]*$'
+# GitBook writes a lone backslash line where the editor had an empty paragraph
+BACKSLASH_PATTERN = r'^ {0,3}\\[ \t]*$'
+ATTRIBUTE_PATTERN = re.compile(r'([\w-]+)="([^"]*)"')
+# {% include "path" %} names its file without an attribute
+PATH_PATTERN = re.compile(r'\s*"([^"]*)"')
+
+
+def parse_tag_body(body):
+    name, _, rest = body.partition(' ')
+    attrs = dict(ATTRIBUTE_PATTERN.findall(rest))
+    path = PATH_PATTERN.match(rest)
+    if path:
+        attrs.setdefault('path', path.group(1))
+    return name.lower(), attrs
+
+
+def parse_gitbook_tag(block, m, state):
+    name, attrs = parse_tag_body(m.group('gitbook_tag_body'))
+    end = name.startswith('end')
+    state.append_token({
+        'type': 'gitbook_tag',
+        'name': name[len('end'):] if end else name,
+        'end': end,
+        'attrs': attrs,
+    })
+    return m.end() + 1
+
+
+def parse_gitbook_backslash(block, m, state):
+    # Dropped without a token, so a paragraph around it simply continues
+    return m.end() + 1
+
+
+def nest_tags(tokens):
+    """
+    Turns the flat open and close tag tokens of one token list into gitbook_block
+    tokens holding their content as children. Tokens are collected in one flat list
+    and each open tag remembers where its content starts, so closing a tag is a
+    single slice and every token is moved once. Tags left open when their parent
+    closes are kept, with their content next to them, since {% embed %} and
+    {% file %} may or may not have an end tag.
+    """
+    flat = []
+    # (name, block token, index of its first child in flat) of each open tag
+    stack = []
+    open_counts = {}
+
+    for token in tokens:
+        if 'children' in token:
+            token['children'] = nest_tags(token['children'])
+        if token['type'] != 'gitbook_tag':
+            flat.append(token)
+        elif not token['end']:
+            block = {'type': 'gitbook_block', 'attrs': {'name': token['name'], **token['attrs']}, 'children': []}
+            flat.append(block)
+            stack.append((token['name'], block, len(flat)))
+            open_counts[token['name']] = open_counts.get(token['name'], 0) + 1
+        elif open_counts.get(token['name']):
+            # Tags opened since stay empty, with their content after them
+            while True:
+                name, block, start = stack.pop()
+                open_counts[name] -= 1
+                if name == token['name']:
+                    break
+            block['children'] = flat[start:]
+            del flat[start:]
+        # An end tag without an open tag is dropped
+
+    return flat
+
+
+def resolve_includes(tokens, includes, page_path):
+    for index, token in enumerate(tokens):
+        if token['type'] == 'gitbook_block' and token['attrs']['name'] == 'include':
+            snippet_path = include_path(token['attrs'].get('path', ''), page_path)
+            tokens[index] = {'type': 'block_html', 'raw': includes.fragment(snippet_path, page_path)}
+        elif 'children' in token:
+            resolve_includes(token['children'], includes, page_path)
+
+
+def nest_tags_hook(md, state, includes=None):
+    state.tokens = nest_tags(state.tokens)
+    # Includes need the page's path, which callers pass in env['__file__']
+    if includes is not None and '__file__' in state.env:
+        resolve_includes(state.tokens, includes, state.env['__file__'])
+
+
+def render_gitbook_block(renderer, text, name, **attrs):
+    if name == 'hint':
+        return f'<div class="note"><h3 class="title">Note</h3>\n{text}</div>\n'
+    if name == 'tabs':
+        return f'<div class="tabs">\n{text}</div>\n'
+    if name == 'tab':
+        title = html.escape(attrs.get('title', ''))
+        return f'<div class="tab"><h3 class="title">{title}</h3>\n{text}</div>\n'
+    if name == 'content-ref':
+        # GitBook exports the card's link as the tag's content; fall back to the url
+        if not text:
+            url = html.escape(attrs.get('url', ''))
+            text = f'<p><a href="{url}">{url}</a></p>\n'
+        return f'<div class="content-ref">\n{text}</div>\n'
+    if name == 'code':
+        title = attrs.get('title')
+        title_html = f'<p class="title">{html.escape(title)}</p>\n' if title else ''
+        return f'<div class="code">\n{title_html}{text}</div>\n'
+    if name in ('embed', 'file'):
+        url = attrs.get('url') or attrs.get('src', '')
+        caption = attrs.get('caption') or (posixpath.basename(url) if name == 'file' else url)
+        return f'<p class="{name}"><a href="{html.escape(url)}">{html.escape(caption)}</a></p>\n{text}'
+    # Unknown tags keep their content and lose the markup
+    return text
+
+
+def gitbook_tags(md, includes=None):
+    """
+    mistune plugin for GitBook's {% %} template tags: hint, tabs, tab, content-ref,
+    code, embed, file and, given an IncludeCache, include. Tags are tokenized by the
+    block parser in the same pass as the rest of the document, then nested in one
+    linear pass before rendering.
+    """
+    md.block.register('gitbook_tag', TAG_PATTERN, parse_gitbook_tag, before='blank_line')
+    md.block.register('gitbook_backslash', BACKSLASH_PATTERN, parse_gitbook_backslash, before='blank_line')
+    # Tags are also recognised inside list items and block quotes
+    for rules in (md.block.list_rules, md.block.block_quote_rules):
+        for rule in ('gitbook_tag', 'gitbook_backslash'):
+            if rule not in rules:
+                rules.insert(rules.index('blank_line'), rule)
+    md.before_render_hooks.append(lambda md, state: nest_tags_hook(md, state, includes))
+    if md.renderer and md.renderer.NAME == 'html':
+        md.renderer.register('gitbook_block', render_gitbook_block)
@@ -1,17 +1,24 @@
 import os
-import re
 import logging
 import mistune
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
 import html
+from memory_budget import PeakMemory
+from link_checker import collect_links
+from gitbook_tags import gitbook_tags
+from includes import IncludeCache, markdown_pages
+from html_minifier import minify_soup
+from journal import PARTIAL_SUFFIX
+from page_features import ALL_FEATURES, BLOCKS, CODE, ENTITIES, TABLES
+from utils import write_atomic
 
 logger = logging.getLogger(__name__)
 
-class MyRenderer(mistune.HTMLRenderer):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.hint_stack = []
+# The table and code passes expect the tree of a re-parsed page: pages with tables or
+# code are serialized after rendering and parsed again before the final passes
+REPARSED_FEATURES = frozenset((TABLES, CODE))
 
+class MyRenderer(mistune.HTMLRenderer):
     def list_item(self, text):
         return f'<li><p>{text}</p></li>'
 
@@ -22,33 +29,54 @@ class MyRenderer(mistune.HTMLRenderer):
             return f'<{tag} style="text-align: {align}"><p>{content}</p></{tag}>'
         return f'<{tag}><p>{content}</p></{tag}>'
 
-    def block_html(self, html):
-        hint_start = re.match(r'{%\s*hint\s+style="(\w+)"\s*%}', html)
-        if hint_start:
-            self.hint_stack.append(hint_start.group(1))
-            return f'<div class="{hint_start.group(1)}">'
-        elif html.strip() == '{% endhint %}' and self.hint_stack:
-            self.hint_stack.pop()
-            return '</div>'
-        return super().block_html(html)
-
-    def paragraph(self, text):
-        if self.hint_stack:
-            return f'<p>{text}</p>'
-        return super().paragraph(text)
-
-    def render(self, tokens, state):
-        output = []
-        for tok in tokens:
-            if tok['type'] == 'block_html':
-                output.append(self.block_html(tok['text']))
-            else:
-                output.append(super().render([tok], state))
-        return ''.join(output)
+def join_strings(string):
+    """
+    Merges string with the string after it, once unwrapping or removing a tag has
+    left them side by side, the way parsing the serialized tree would: whitespace
+    outside <pre> becomes a single newline or space. Pages on the fast path then
+    serialize exactly as the re-parsed ones do.
+    """
+    following = string.next_sibling if string is not None else None
+    if type(string) is not NavigableString or type(following) is not NavigableString:
+        return
+    text = string + following
+    if not text.strip(BeautifulSoup.ASCII_SPACES) and not string.find_parent(['pre', 'textarea']):
+        text = '\n' if '\n' in text else ' '
+    following.extract()
+    string.replace_with(NavigableString(text))
+
+class HTMLIncludeCache(IncludeCache):
+    def render(self, text, snippet_path):
+        return render_fragment(HTMLConverter(None).correct_markdown_tables(text), snippet_path)
+
+
+# One per process, so that worker processes keep their rendered snippets between pages
+include_cache = HTMLIncludeCache()
+
+
+def create_markdown():
+    renderer = MyRenderer(escape=False)
+    return mistune.create_markdown(renderer=renderer,
+                                   plugins=['table', lambda md: gitbook_tags(md, include_cache)])
+
+
+def render_fragment(markdown_text, path):
+    """
+    Renders Markdown to HTML without the post-processing, which runs once on the whole
+    page. path locates the relative includes of the text.
+    """
+    markdown = create_markdown()
+    state = markdown.block.state_cls()
+    state.env['__file__'] = path
+    html_content, _ = markdown.parse(markdown_text, state)
+    return html_content
+
 
 class HTMLConverter:
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, minify=False):
         self.folder_path = folder_path
+        # Minify the page as it is written, see html_minifier
+        self.minify = minify
 
     def correct_markdown_tables(self, markdown_content):
         lines = markdown_content.split('\n')
@@ -82,44 +110,54 @@ class HTMLConverter:
 
         return '\n'.join(corrected_lines)
 
-    def convert_markdown_to_html(self, markdown_file_path):
+    def convert_markdown_to_html(self, markdown_file_path, features=None):
+        # Hand the text straight to render_soup so that it holds the only reference
         with open(markdown_file_path, 'r', encoding='utf-8') as file:
-            markdown_text = file.read()
-
-        # Clean up the Markdown
-        markdown_text = re.sub(r'\n\\$', '', markdown_text, flags=re.MULTILINE)  # Remove trailing backslashes
-        markdown_text = re.sub(r'\n\s*\n', '\n\n', markdown_text)  # Remove multiple empty lines
-
-        # Replace hint blocks before Markdown conversion
-        markdown_text = re.sub(r'{%\s*hint\s+style="(\w+)"\s*%}', r'<div class="note"><h3 class="title">Note</h3>', markdown_text)
-        markdown_text = re.sub(r'{%\s*endhint\s*%}', '</div>', markdown_text)
-
-        # Unescape HTML entities in the markdown text
-        markdown_text = html.unescape(markdown_text)
+            return self.serialize(self.render_soup(file.read(), markdown_file_path, features))
+
+    def render_markdown(self, markdown_text, source_path=None, features=None):
+        return self.serialize(self.render_soup(markdown_text, source_path, features))
+
+    def render_soup(self, markdown_text, source_path=None, features=None):
+        # GitBook tags and lone backslash lines are tokenized by the gitbook_tags plugin
+        # while mistune parses; mistune also decodes entity references itself.
+        # Each stage drops the previous stage's copy as soon as it has been consumed.
+        # features, from page_features.scan_features, skips the passes for constructs
+        # the page does not contain; None runs them all
+        features = ALL_FEATURES if features is None else features
+        if TABLES in features:
+            markdown_text = self.correct_markdown_tables(markdown_text)
+        html_content = render_fragment(markdown_text, source_path) if source_path \
+            else create_markdown()(markdown_text)
+        del markdown_text
 
-        corrected_markdown = self.correct_markdown_tables(markdown_text)
-        renderer = MyRenderer(escape=False)
-        markdown = mistune.create_markdown(renderer=renderer, plugins=['table'])
-        html_content = markdown(corrected_markdown)
-        
         # Post-process HTML
         soup = BeautifulSoup(html_content, 'html.parser')
+        del html_content
         
-        # Remove <p> tags wrapping hint blocks
-        for div in soup.find_all('div', class_=True):
-            if div.parent and div.parent.name == 'p':
-                div.parent.replace_with(div)
+        # Remove <p> tags wrapping GitBook blocks, keeping whatever else they wrap
+        if BLOCKS in features:
+            for div in soup.find_all('div', class_=True):
+                if div.parent and div.parent.name == 'p':
+                    paragraph = div.parent
+                    edges = (paragraph.previous_sibling, paragraph.contents[-1])
+                    paragraph.unwrap()
+                    for string in edges:
+                        join_strings(string)
         
         # Handle pre and code tags
-        self.process_pre_tags(soup)
-        self.process_code_tags(soup)
+        if CODE in features:
+            self.process_pre_tags(soup)
+            self.process_code_tags(soup)
 
         # Remove empty paragraphs
         for p in soup.find_all('p'):
             if not p.contents or (len(p.contents) == 1 and isinstance(p.contents[0], str) and not p.contents[0].strip()):
+                previous = p.previous_sibling
                 p.decompose()
+                join_strings(previous)
 
-        return str(soup)
+        return soup
 
     def process_pre_tags(self, soup):
         for pre in soup.find_all('pre'):
@@ -153,27 +191,45 @@ class HTMLConverter:
             else:
                 code['class'] = ['code']
 
-    def manipulate_html(self, html_content):
+    def manipulate_html(self, html_content, page_links=None, features=None):
         soup = BeautifulSoup(html_content, 'html.parser')
+        del html_content
+        return self.manipulate_soup(soup, page_links, features)
+
+    def manipulate_soup(self, soup, page_links=None, features=None):
+        features = ALL_FEATURES if features is None else features
         first_element = soup.find()
         if first_element and first_element.name == 'h1':
             first_element.decompose()
 
-        for thead in soup.find_all('thead'):
-            if not thead.get_text(strip=True):
-                thead.decompose()
+        if TABLES in features:
+            for thead in soup.find_all('thead'):
+                if not thead.get_text(strip=True):
+                    thead.decompose()
 
-        self.remove_empty_columns(soup)
-        self.process_table_cells(soup)
-        self.convert_td_to_th(soup)
-        self.add_table_border(soup)
+            self.remove_empty_columns(soup)
+            self.process_table_cells(soup)
+            self.convert_td_to_th(soup)
+            self.add_table_border(soup)
 
         # Unescape HTML entities in all text nodes
-        for text in soup.find_all(text=True):
-            unescaped_text = html.unescape(text.string)
-            text.replace_with(unescaped_text)
+        if ENTITIES in features:
+            for text in soup.find_all(text=True):
+                unescaped_text = html.unescape(text.string)
+                text.replace_with(unescaped_text)
 
-        return str(soup)
+        # Index the page's anchors and links from the tree already in memory
+        if page_links is not None:
+            page_links.update(collect_links(soup))
+
+        return self.serialize(soup, self.minify)
+
+    def serialize(self, soup, minify=False):
+        html_content = minify_soup(soup) if minify else str(soup)
+        # Soup trees are full of parent/child reference cycles; breaking them frees the
+        # tree right away instead of at the next garbage collection
+        soup.decompose()
+        return html_content
 
     def remove_empty_columns(self, soup):
         for table in soup.find_all('table'):
@@ -233,15 +289,74 @@ class HTMLConverter:
             if table.find('thead'):
                 table['style'] = table.get('style', '') + ' border-top: 0.5px solid #000000 !important;'
 
-    def convert_all(self):
-        for root, _, files in os.walk(self.folder_path):
-            for file in files:
-                if file.endswith('.md'):
-                    md_path = os.path.join(root, file)
-                    html_content = self.convert_markdown_to_html(md_path)
-                    manipulated_html = self.manipulate_html(html_content)
-                    html_path = os.path.splitext(md_path)[0] + '.html'
-                    with open(html_path, 'w', encoding='utf-8') as f:
-                        f.write(manipulated_html)
-                    os.remove(md_path)
-                    logger.info(f"Converted and manipulated: {md_path} to {html_path}")
\ No newline at end of file
+    def find_markdown_files(self):
+        return markdown_pages(self.folder_path)
+
+    def convert_file(self, md_path, html_path=None, remove_source=True, page_links=None, features=None):
+        features = ALL_FEATURES if features is None else features
+        if features & REPARSED_FEATURES:
+            manipulated_html = self.manipulate_html(self.convert_markdown_to_html(md_path, features), page_links,
+                                                    features)
+        else:
+            # The fast path: the final passes run on the rendered tree itself, with no
+            # serialization and second parse in between
+            with open(md_path, 'r', encoding='utf-8') as file:
+                soup = self.render_soup(file.read(), md_path, features)
+            manipulated_html = self.manipulate_soup(soup, page_links, features)
+        if html_path is None:
+            html_path = os.path.splitext(md_path)[0] + '.html'
+        # A run that dies mid-write leaves a temporary file, never a truncated page
+        write_atomic(html_path, manipulated_html, suffix=PARTIAL_SUFFIX)
+        if remove_source:
+            os.remove(md_path)
+        logger.info(f"Converted and manipulated: {md_path} to {html_path}")
+        return html_path
+
+    def convert_all(self, journal=None):
+        """
+        Converts every page. With a ConversionJournal, pages it already holds are
+        skipped, and each converted page is journaled before its source is deleted.
+        """
+        for md_path in self.find_markdown_files():
+            if journal is None:
+                self.convert_file(md_path)
+            elif journal.completed(md_path):
+                # Journaled by a run that died before deleting the source
+                os.remove(md_path)
+            else:
+                page_links = {}
+                html_path = self.convert_file(md_path, remove_source=False, page_links=page_links)
+                journal.record(md_path, {'html_path': html_path, **page_links})
+
+
+def convert_file(folder_path, md_path, minify=False):
+    # Module-level entry point so that pages can be converted in worker processes
+    return HTMLConverter(folder_path, minify).convert_file(md_path)
+
+def convert_file_indexed(folder_path, md_path, minify=False, remove_source=True, features=None):
+    """
+    Same as convert_file, but also returns the anchors and internal links of the page,
+    for the site-wide link index, and the include cache lookups it made.
+    """
+    page_links = {}
+    hits, misses = include_cache.stats()
+    html_path = HTMLConverter(folder_path, minify).convert_file(md_path, remove_source=remove_source,
+                                                                page_links=page_links, features=features)
+    total_hits, total_misses = include_cache.stats()
+    return {'md_path': md_path, 'html_path': html_path, 'cache_hits': total_hits - hits,
+            'cache_misses': total_misses - misses, **page_links}
+
+def convert_file_measured(folder_path, md_path, minify=False, remove_source=True, features=None):
+    """
+    Same as convert_file_indexed, but also reports the page's source size and the
+    memory the worker needed for it, for the memory-bounded mode.
+    """
+    source_bytes = os.path.getsize(md_path)
+    with PeakMemory() as memory:
+        page = convert_file_indexed(folder_path, md_path, minify, remove_source, features)
+    return {
+        **page,
+        'source_bytes': source_bytes,
+        'base_bytes': memory.base_bytes,
+        'peak_bytes': memory.peak_bytes,
+    }
\ No newline at end of file
@@ -0,0 +1,161 @@
+import re
+from bs4 import NavigableString, Tag
+
+# Elements around which whitespace is not rendered
+BLOCK_ELEMENTS = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'body', 'caption', 'col', 'colgroup', 'dd', 'details',
+    'div', 'dl', 'dt', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'head', 'header', 'hr', 'html', 'li', 'link', 'main', 'meta', 'nav', 'ol', 'p', 'pre', 'section',
+    'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'title', 'tr', 'ul',
+))
+# Elements whose text is kept exactly as it is
+PRESERVE_ELEMENTS = frozenset(('pre', 'textarea', 'script', 'style'))
+# Elements whose text is written without escaping
+RAW_TEXT_ELEMENTS = frozenset(('script', 'style'))
+# Attribute values that only restate the default
+DEFAULT_ATTRIBUTES = {'colspan': '1', 'rowspan': '1'}
+# Attributes that mean nothing when empty
+DROP_WHEN_EMPTY = frozenset(('class', 'style', 'id', 'title'))
+
+WHITESPACE = re.compile(r'[ \t\n\r\f]+')
+QUOTED = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+QUOTED_STRING = re.compile(f'({QUOTED})')
+# Declarations end at a ';' outside quotes and parentheses: not at the one in
+# url(data:image/png;base64,...)
+DECLARATION_PARTS = re.compile(QUOTED + r'|[()]|;')
+IMPORTANT = re.compile(r'\s*!\s*important\s*$', re.IGNORECASE)
+
+
+def escape_text(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attribute(value):
+    return escape_text(value).replace('"', '&quot;')
+
+
+def split_declarations(style):
+    declarations = []
+    depth = start = 0
+    for match in DECLARATION_PARTS.finditer(style):
+        token = match.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(depth - 1, 0)
+        elif token == ';' and depth == 0:
+            declarations.append(style[start:match.start()])
+            start = match.end()
+    declarations.append(style[start:])
+    return declarations
+
+
+def collapse_whitespace(value):
+    # Quoted strings, such as font names or data in url("..."), keep their whitespace
+    parts = QUOTED_STRING.split(value)
+    return ''.join(part if index % 2 else WHITESPACE.sub(' ', part) for index, part in enumerate(parts))
+
+
+def minify_style(style):
+    """
+    Keeps the declaration that wins for each property, in order, written compactly:
+    'color: red; margin: 0; color: blue' becomes 'margin:0;color:blue'. A declaration
+    marked !important is only replaced by another !important one. Property names are
+    case-insensitive except custom properties (--name); values are left as they are
+    apart from whitespace outside quotes.
+    """
+    declarations = {}
+    for declaration in split_declarations(style):
+        name, colon, value = declaration.partition(':')
+        name = name.strip()
+        if not name.startswith('--'):
+            name = name.lower()
+        value = collapse_whitespace(value.strip())
+        if not colon or not name or not value:
+            continue
+        important = bool(IMPORTANT.search(value))
+        if important:
+            value = IMPORTANT.sub('', value) + '!important'
+        previous = declarations.pop(name, None)
+        if previous and previous[1] and not important:
+            declarations[name] = previous
+        else:
+            declarations[name] = (value, important)
+    return ';'.join(f"{name}:{value}" for name, (value, _) in declarations.items())
+
+
+def minify_attributes(tag):
+    attributes = []
+    for name, value in tag.attrs.items():
+        if isinstance(value, list):
+            # Multi-valued attributes such as class, without repeated values
+            value = ' '.join(dict.fromkeys(value))
+        if name == 'style':
+            value = minify_style(value)
+        if DEFAULT_ATTRIBUTES.get(name) == value or (name in DROP_WHEN_EMPTY and not value.strip()):
+            continue
+        attributes.append(f' {name}="{escape_attribute(value)}"')
+    return ''.join(attributes)
+
+
+def is_block(node):
+    return isinstance(node, Tag) and node.name in BLOCK_ELEMENTS
+
+
+class MinifyingSerializer:
+    """
+    Writes a BeautifulSoup tree as HTML in one walk, in place of str(soup):
+    whitespace outside pre, textarea, script and style is collapsed, and dropped where
+    it only separates block elements; empty and default-valued attributes are left
+    out; repeated classes and inline style declarations are written once.
+    """
+
+    def __init__(self):
+        self.out = []
+
+    def text(self, node, preserve):
+        if type(node) is not NavigableString:
+            # Comments, doctypes and other declarations keep their markup
+            self.out.append(node.output_ready())
+            return
+        if preserve:
+            parent = node.parent
+            self.out.append(str(node) if parent is not None and parent.name in RAW_TEXT_ELEMENTS
+                            else escape_text(node))
+            return
+        text = WHITESPACE.sub(' ', node)
+        parent = node.parent
+        if parent is None or is_block(parent) or parent.name == '[document]':
+            # Whitespace at the edge of a block, or next to a block, is not rendered
+            previous, following = node.previous_sibling, node.next_sibling
+            if previous is None or is_block(previous):
+                text = text.lstrip(' ')
+            if following is None or is_block(following):
+                text = text.rstrip(' ')
+        if text:
+            self.out.append(escape_text(text))
+
+    def tag(self, tag, preserve):
+        self.out.append(f"<{tag.name}{minify_attributes(tag)}")
+        if tag.is_empty_element:
+            self.out.append("/>")
+            return
+        self.out.append(">")
+        preserve = preserve or tag.name in PRESERVE_ELEMENTS
+        self.children(tag, preserve)
+        self.out.append(f"</{tag.name}>")
+
+    def children(self, parent, preserve):
+        for child in parent.contents:
+            if isinstance(child, Tag):
+                self.tag(child, preserve)
+            else:
+                self.text(child, preserve)
+
+    def serialize(self, soup):
+        self.children(soup, False)
+        return ''.join(self.out)
+
+
+def minify_soup(soup):
+    return MinifyingSerializer().serialize(soup)
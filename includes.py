@@ -0,0 +1,189 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# {% include "../.gitbook/includes/snippet.md" %} on a line of its own
+INCLUDE_PATTERN = re.compile(r'^[ \t]*\{%[ \t]*include[ \t]+"([^"]+)"[ \t]*%\}[ \t]*$', re.MULTILINE)
+# URLs inside a rendered fragment, relative to the snippet, which are rebased for each page
+HTML_URL_PATTERN = re.compile(r'((?:href|src)=")([^"]*)(")')
+MARKDOWN_URL_PATTERN = re.compile(r'(\]\(|(?:href|src)=")([^)"\s]*)([)"\s])')
+# Any include tag, to find the snippets the pages of a folder pull in
+INCLUDE_TAG_PATTERN = re.compile(r'\{%[ \t]*include[ \t]+"([^"]+)"[ \t]*%\}')
+
+
+class IncludeCycleError(ValueError):
+    pass
+
+
+def include_path(target, page_path):
+    return os.path.normpath(os.path.join(os.path.dirname(page_path), target))
+
+
+def include_targets(md_paths):
+    """
+    Returns the real paths of the files md_paths include, directly or through other
+    snippets. They are fragments of the pages that include them, not pages.
+    """
+    targets = set()
+    stack = list(md_paths)
+    while stack:
+        path = stack.pop()
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                text = file.read()
+        except OSError:
+            continue
+        for target in INCLUDE_TAG_PATTERN.findall(text):
+            snippet_path = os.path.realpath(include_path(target, path))
+            if snippet_path not in targets:
+                targets.add(snippet_path)
+                stack.append(snippet_path)
+    return targets
+
+
+def markdown_pages(folder_path):
+    """
+    Returns the Markdown pages under folder_path. Snippets are left out: those in
+    .gitbook, where GitBook keeps them, and any other file a page includes. Their
+    sources must stay in place for every page that includes them.
+    """
+    md_paths = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if d != '.gitbook']
+        md_paths.extend(os.path.join(root, file) for file in files if file.endswith('.md'))
+    snippets = include_targets(md_paths)
+    return [md_path for md_path in md_paths if os.path.realpath(md_path) not in snippets]
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def rebase_url(url, snippet_folder, page_folder):
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not parts.path or parts.path.startswith('/'):
+        return url
+    target = os.path.normpath(os.path.join(snippet_folder, parts.path))
+    rebased = os.path.relpath(target, page_folder).replace(os.sep, '/')
+    return rebased + (f"#{parts.fragment}" if parts.fragment else '')
+
+
+class IncludeCache:
+    """
+    Renders each included snippet once per process and build, keyed by its path and a
+    hash of its content, so a snippet shared by hundreds of pages is parsed once and
+    an edited snippet is rendered again. A fragment also remembers the content hashes
+    of the snippets it includes, at any depth, and is rendered again when one of them
+    changes. Relative URLs in a fragment are rebased onto each including page.
+
+    Subclasses implement render(text, snippet_path); nested includes resolve through
+    the same cache, which raises IncludeCycleError when a snippet includes itself.
+    """
+    url_pattern = HTML_URL_PATTERN
+
+    def __init__(self):
+        self.fragments = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def render(self, text, snippet_path):
+        raise NotImplementedError
+
+    def _resolving(self):
+        if not hasattr(self._local, 'chain'):
+            self._local.chain = []
+            # The nested snippets each fragment being rendered pulls in
+            self._local.dependencies = []
+        return self._local.chain
+
+    def _segments(self, snippet_path):
+        chain = self._resolving()
+        if snippet_path in chain:
+            cycle = chain[chain.index(snippet_path):] + [snippet_path]
+            raise IncludeCycleError("Include cycle: " + " -> ".join(cycle))
+        if not os.path.isfile(snippet_path):
+            raise FileNotFoundError(f"Included file not found: {snippet_path}")
+
+        with open(snippet_path, 'rb') as file:
+            content = file.read()
+        key = (snippet_path, hashlib.sha1(content).hexdigest())
+        with self.lock:
+            cached = self.fragments.get(key)
+        if cached is not None and all(file_digest(path) == digest for path, digest in cached[1]):
+            with self.lock:
+                self.hits += 1
+            self._depends_on(key, cached[1])
+            return cached[0]
+        with self.lock:
+            self.misses += 1
+
+        chain.append(snippet_path)
+        self._local.dependencies.append(set())
+        try:
+            rendered = self.render(content.decode('utf-8'), snippet_path)
+        finally:
+            chain.pop()
+            dependencies = frozenset(self._local.dependencies.pop())
+        # Even indexes hold text, odd indexes the URLs to rebase
+        segments = []
+        position = 0
+        for match in self.url_pattern.finditer(rendered):
+            segments.append(rendered[position:match.end(1)])
+            segments.append(match.group(2))
+            position = match.start(3)
+        segments.append(rendered[position:])
+        with self.lock:
+            self.fragments[key] = (segments, dependencies)
+        self._depends_on(key, dependencies)
+        return segments
+
+    def _depends_on(self, key, dependencies):
+        # The fragment being rendered around this one, if any, depends on it and on
+        # everything it includes
+        if self._local.dependencies:
+            self._local.dependencies[-1].update(dependencies, (key,))
+
+    def fragment(self, snippet_path, page_path):
+        """
+        Returns the snippet rendered for the page at page_path.
+        """
+        snippet_path = os.path.realpath(snippet_path)
+        segments = self._segments(snippet_path)
+        snippet_folder = os.path.dirname(snippet_path)
+        page_folder = os.path.dirname(os.path.realpath(page_path))
+        if snippet_folder == page_folder:
+            return ''.join(segments)
+        return ''.join(segment if index % 2 == 0 else rebase_url(segment, snippet_folder, page_folder)
+                       for index, segment in enumerate(segments))
+
+    def stats(self):
+        with self.lock:
+            return self.hits, self.misses
+
+
+class MarkdownIncludeCache(IncludeCache):
+    """
+    Expands includes at the Markdown level, for the converters that hand Markdown to
+    another tool (md2ft, md2ftml).
+    """
+    url_pattern = MARKDOWN_URL_PATTERN
+
+    def render(self, text, snippet_path):
+        return self.expand(text, snippet_path)
+
+    def expand(self, text, page_path):
+        if '{%' not in text:
+            return text
+        return INCLUDE_PATTERN.sub(
+            lambda m: self.fragment(include_path(m.group(1), page_path), page_path).rstrip('\n'), text)
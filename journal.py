@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Suffix of the temporary files pages are written to before being renamed into place
+PARTIAL_SUFFIX = '.tmp'
+
+
+def journal_path(folder_path):
+    return f"{os.path.basename(os.path.normpath(folder_path))}.journal"
+
+
+def remove_partial_writes(folder_path):
+    """
+    Removes the temporary files a run that died mid-write left behind. Returns how
+    many there were.
+    """
+    removed = 0
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for file in files:
+            if file.startswith('.') and '.html.' in file and file.endswith(PARTIAL_SUFFIX):
+                os.remove(os.path.join(root, file))
+                removed += 1
+    return removed
+
+
+def ends_with_newline(path):
+    with open(path, 'rb') as file:
+        if file.seek(0, os.SEEK_END) == 0:
+            return True
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+
+class ConversionJournal:
+    """
+    Write-ahead journal of the pages a run has converted, one JSON line per page.
+
+    A page is converted as: write its HTML to a temporary file and rename it into
+    place, append its line to the journal, then delete its Markdown source. Whenever
+    the process dies, every page is therefore either still a .md file or journaled
+    with a complete HTML file, and a resumed run picks up the journaled pages as they
+    are. Lines are flushed, not fsynced: the journal survives the process being
+    killed, not the machine losing power.
+
+    Entries hold the page's source and HTML paths relative to the folder, the size of
+    its source and the anchors and links of the link index.
+    """
+
+    def __init__(self, path, folder_path):
+        self.path = path
+        self.folder_path = folder_path
+        self.entries = {}
+        self.file = None
+        self.lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Reads the entries of an earlier run, ignoring a last line cut short by a crash.
+        """
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, start=1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring incomplete line {number} of {self.path}")
+                    continue
+                self.entries[entry['page']] = entry
+        return self.entries
+
+    def page_name(self, path):
+        return os.path.relpath(path, self.folder_path).replace(os.sep, '/')
+
+    def completed(self, md_path):
+        """
+        Returns the entry of a journaled page whose HTML is in place, or None.
+        """
+        entry = self.entries.get(self.page_name(md_path))
+        if entry and os.path.exists(os.path.join(self.folder_path, entry['html_path'])):
+            return entry
+        return None
+
+    def page_report(self, entry):
+        # The same report convert_file_indexed returns, as if the page had just been converted
+        return {
+            'md_path': os.path.join(self.folder_path, entry['page']),
+            'html_path': os.path.join(self.folder_path, entry['html_path']),
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'anchors': entry.get('anchors', []),
+            'links': entry.get('links', []),
+        }
+
+    def record(self, md_path, page):
+        """
+        Journals a converted page, then deletes its source. page is the report of
+        convert_file_indexed.
+        """
+        entry = {
+            'page': self.page_name(md_path),
+            'html_path': self.page_name(page['html_path']),
+            'source_bytes': os.path.getsize(md_path),
+            'anchors': page.get('anchors', []),
+            'links': page.get('links', []),
+        }
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+                if not ends_with_newline(self.path):
+                    # A line cut short by a crash must not swallow the first new one
+                    self.file.write("\n")
+            self.file.write(line)
+            self.file.flush()
+            self.entries[entry['page']] = entry
+        os.remove(md_path)
+        return entry
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def remove(self):
+        # A finished run leaves nothing to resume
+        self.close()
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import logging
+import threading
+from urllib.parse import unquote, urlsplit
+from reachability import leaves_folder, link_target, resolve
+
+logger = logging.getLogger(__name__)
+
+HEADINGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+
+def heading_slug(text):
+    # GitBook derives a heading's anchor from its text
+    slug = re.sub(r'[^\w\s-]', '', text.strip().lower())
+    return re.sub(r'\s+', '-', slug)
+
+
+def collect_links(soup):
+    """
+    Returns the anchors a converted page defines and the internal links it contains,
+    read from the page's parsed tree while the converter already holds it.
+    """
+    anchors = set()
+    for tag in soup.find_all(attrs={'id': True}):
+        anchors.add(tag['id'])
+    for tag in soup.find_all('a', attrs={'name': True}):
+        anchors.add(tag['name'])
+    for heading in soup.find_all(HEADINGS):
+        anchors.add(heading_slug(heading.get_text()))
+
+    links = []
+    for tag, attribute in (('a', 'href'), ('img', 'src')):
+        for element in soup.find_all(tag, attrs={attribute: True}):
+            url = element[attribute]
+            if is_internal(url):
+                links.append(url)
+    return {'anchors': sorted(anchors), 'links': links}
+
+
+def is_internal(url):
+    parts = urlsplit(url)
+    return bool(url) and not parts.scheme and not parts.netloc
+
+
+class BrokenLink:
+    def __init__(self, page, url, reason):
+        self.page = page
+        self.url = url
+        self.reason = reason
+
+    def to_dict(self):
+        return {'page': self.page, 'url': self.url, 'reason': self.reason}
+
+    def __str__(self):
+        return f"{self.page}: {self.url} ({self.reason})"
+
+
+class LinkIndex:
+    """
+    Site-wide index of converted pages, the anchors they define and the internal
+    links they contain. Pages are added as they are converted; validate() then
+    resolves every link against the index.
+
+    Links are resolved by reachability.resolve, as package pruning resolves them:
+    links to .md files lead to the page they were converted to, and links to a
+    folder to its README page, as GitBook does.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.pages = {}
+        self.links = {}
+        self.lock = threading.Lock()
+
+    def page_name(self, path):
+        return os.path.relpath(path, self.folder_path).replace(os.sep, '/')
+
+    def add_page(self, html_path, page_links):
+        page = self.page_name(html_path)
+        with self.lock:
+            self.pages[page] = set(page_links['anchors'])
+            self.links[page] = page_links['links']
+
+    def __contains__(self, name):
+        # Converted pages and the files beside them, for reachability.resolve. Markdown
+        # sources are not published, so a link to one resolves to its converted page
+        if name in self.pages:
+            return True
+        return not name.endswith('.md') and os.path.isfile(os.path.join(self.folder_path, name))
+
+    def target(self, page, url):
+        """
+        Returns the publication path url points to from page, and its fragment. The path
+        is None if url leaves the publication or leads to nothing in it.
+        """
+        parts = urlsplit(url)
+        path = unquote(parts.path)
+        fragment = unquote(parts.fragment)
+        return (resolve(self, page, path) if path else page), fragment
+
+    def resolve(self, page, url):
+        """
+        Returns None if url, found on page, resolves; otherwise the reason it does not.
+        """
+        target, fragment = self.target(page, url)
+        if target is None:
+            path = link_target(page, unquote(urlsplit(url).path))
+            if leaves_folder(path):
+                return "points outside the publication"
+            return f"{path} does not exist"
+        if target in self.pages:
+            if fragment and fragment not in self.pages[target] and fragment.lower() not in self.pages[target]:
+                return f"no anchor #{fragment} in {target}"
+        return None
+
+    def local_files(self, page):
+        """
+        Returns the files other than pages, such as images, that page links to.
+        """
+        files = set()
+        for url in self.links.get(page, ()):
+            target, _ = self.target(page, url)
+            if target and target not in self.pages:
+                files.add(target)
+        return files
+
+    def validate(self):
+        # Resolving links is pure Python work: threads would only contend for the GIL
+        broken = []
+        for page in sorted(self.links):
+            for url in self.links[page]:
+                reason = self.resolve(page, url)
+                if reason:
+                    broken.append(BrokenLink(page, url, reason))
+        return broken
+
+    def link_count(self):
+        return sum(len(links) for links in self.links.values())
+
+
+def write_report(path, index, broken):
+    report = {
+        'pages': len(index.pages),
+        'links': index.link_count(),
+        'broken': [link.to_dict() for link in broken],
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+    return path
@@ -1,15 +1,330 @@
 import logging
+import os
 import sys
+import argparse
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from gitbook_processor import GitBookProcessor
-from html_converter import HTMLConverter
+from html_converter import HTMLConverter, convert_file_indexed, convert_file_measured
+from journal import ConversionJournal, journal_path, remove_partial_writes
+from page_features import conversion_path, scan_pages
 from ftmap_generator import FTMapGenerator
 from fluid_topics_client import FluidTopicsClient
-from utils import create_zip_archive, load_config
+from link_checker import LinkIndex, write_report
+from archive_parts import ArchiveSplitter
+from memory_budget import MemoryBudget, map_within_budget
+from metrics import RunMetrics
+from pipeline import PipelineAborted, PipelineScheduler
+from profiling import Profiler, profile_task
+from reachability import Reachability, excluded_report, resolve, toc_pages
+from utils import load_config, zip_archive_path
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
+def convert_within_budget(processed_folder, md_paths, budget_mb, add_page, minify=False, features=None):
+    """
+    Converts pages while keeping the estimated resident memory of the run under
+    budget_mb, logs the peak memory of every page and hands its report to add_page.
+    """
+    workers = os.cpu_count() or 1
+    budget = MemoryBudget(budget_mb * 2**20, workers)
+    # Large pages first, so the biggest ones are measured early and never end up
+    # competing with each other at the end of the run. Sources are kept for add_page
+    # to journal the page before deleting them
+    features = features or {}
+    tasks = sorted((((processed_folder, md_path, minify, False, features.get(md_path)), os.path.getsize(md_path))
+                    for md_path in md_paths),
+                   key=lambda task: task[1], reverse=True)
+    largest = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for report in map_within_budget(executor, convert_file_measured, tasks, budget):
+            page_mb = max(0, report['peak_bytes'] - report['base_bytes']) / 2**20
+            logger.info(f"Peak memory for {report['html_path']}: {report['peak_bytes'] / 2**20:.1f} MB "
+                        f"(+{page_mb:.1f} MB for the page)")
+            if largest is None or report['peak_bytes'] > largest['peak_bytes']:
+                largest = report
+            add_page(report)
+    if largest:
+        logger.info(f"Highest page peak: {largest['peak_bytes'] / 2**20:.1f} MB ({largest['html_path']}); "
+                    f"highest estimated total: {budget.peak_estimate / 2**20:.1f} MB of {budget_mb} MB")
+
+def build_pipeline(processed_folder, config, metrics, profiler, journal):
+    """
+    Models the migration as a stage graph:
+
+        convert --pages--> archive --+--> seal ---+
+        ftmap ------------------------+--> links --+--> upload
+
+    Converted pages stream into the open archive as soon as they are written and
+    reachable from SUMMARY.md (along with the images they link to), the FTMAP is
+    built from SUMMARY.md alongside the page conversion, the internal links
+    collected during conversion are validated while the archive is sealed, and the
+    upload starts once both are done.
+
+    Each converted page is recorded in the journal before its source is deleted;
+    pages the journal already holds, from an interrupted run, are not converted again.
+    """
+    html_converter = HTMLConverter(processed_folder)
+    link_index = LinkIndex(processed_folder)
+    summary_md = os.path.join(processed_folder, 'SUMMARY.md')
+    summary_html = os.path.join(processed_folder, 'SUMMARY.html')
+    ftmap_path = os.path.join(processed_folder, 'SUMMARY.ftmap')
+    resumed = {}
+    for page in journal.entries:
+        md_path = os.path.join(processed_folder, page)
+        if journal.completed(md_path):
+            resumed[md_path] = journal.entries[page]
+    md_paths = sorted(set(html_converter.find_markdown_files()) | set(resumed))
+    html_paths = {os.path.splitext(md_path)[0] + '.html' for md_path in md_paths}
+    # Everything that is not a page goes into the archive as is, if a page links to it.
+    # Pages and the FTMAP left by an interrupted run are written again by this one
+    asset_paths = []
+    for root, _, files in os.walk(processed_folder):
+        asset_paths.extend(path for path in (os.path.join(root, file) for file in files)
+                           if not path.endswith('.md') and path not in html_paths and path != ftmap_path)
+    asset_names = [link_index.page_name(path) for path in asset_paths]
+    files = dict(zip(asset_names, asset_paths))
+    for html_path in html_paths - {summary_html}:
+        files[link_index.page_name(html_path)] = html_path
+    reachability = None
+    if config['prune_unreachable']:
+        summary_toc = summary_md if summary_md not in resumed else summary_html
+        roots = (resolve(files, 'SUMMARY.md', page) for page in toc_pages(summary_toc))
+        reachability = Reachability(files, [root for root in roots if root])
+    zip_file = zip_archive_path(processed_folder)
+    minify = config['minify_html']
+    metrics.set('bytes_in', sum(resumed[md_path]['source_bytes'] if md_path in resumed else os.path.getsize(md_path)
+                                for md_path in md_paths))
+    metrics.set('pages_total', len(md_paths))
+
+    def index_page(page):
+        link_index.add_page(page['html_path'], page)
+        metrics.inc('cache_hits', page['cache_hits'])
+        metrics.inc('cache_misses', page['cache_misses'])
+
+    def resume_page(md_path):
+        # The run that journaled the page may have died before deleting its source
+        if os.path.exists(md_path):
+            os.remove(md_path)
+        metrics.inc('pages_resumed')
+        return journal.page_report(resumed[md_path])
+
+    def convert(stage, results):
+        pages = stage.outputs['pages']
+
+        def add_page(page):
+            index_page(page)
+            pages.put(page['html_path'])
+
+        def finish_page(page):
+            journal.record(page['md_path'], page)
+            add_page(page)
+
+        for md_path in resumed:
+            if md_path != summary_md:
+                add_page(resume_page(md_path))
+        page_paths = [md_path for md_path in md_paths if md_path != summary_md and md_path not in resumed]
+        # One byte-level scan per page decides which passes it needs
+        features = scan_pages(page_paths)
+        by_path = {}
+        for page_features in features.values():
+            path = conversion_path(page_features)
+            by_path[path] = by_path.get(path, 0) + 1
+        metrics.set('pages_by_path', by_path)
+        logger.info("Conversion paths: " + ", ".join(f"{count} {path}" for path, count in sorted(by_path.items())))
+        try:
+            profile_page = config['profile_page'] and os.path.join(processed_folder, config['profile_page'])
+            if profile_page in page_paths:
+                # Converted on its own, in this process, so that its profile holds nothing else
+                page_paths.remove(profile_page)
+                with profiler.stage(f"page {config['profile_page']}"):
+                    page = convert_file_indexed(processed_folder, profile_page, minify, False, features[profile_page])
+                finish_page(page)
+            elif profile_page:
+                logger.warning(f"PROFILE_PAGE {config['profile_page']} is not a page of {processed_folder}")
+
+            if config['memory_budget_mb']:
+                convert_within_budget(processed_folder, page_paths, config['memory_budget_mb'], finish_page, minify,
+                                      features)
+            else:
+                # Profiled workers are spawned: a worker forked while this stage runs
+                # cProfile could not start its own on Python 3.12+
+                mp_context = multiprocessing.get_context('spawn') if profiler.enabled else None
+                with ProcessPoolExecutor(mp_context=mp_context) as executor:
+                    if profiler.enabled:
+                        futures = [executor.submit(profile_task, profiler.output_dir, 'convert_all workers',
+                                                   convert_file_indexed, processed_folder, md_path, minify, False,
+                                                   features[md_path])
+                                   for md_path in page_paths]
+                    else:
+                        futures = [executor.submit(convert_file_indexed, processed_folder, md_path, minify, False,
+                                                   features[md_path])
+                                   for md_path in page_paths]
+                    try:
+                        for future in as_completed(futures):
+                            page = future.result()
+                            finish_page(page)
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+        except PipelineAborted:
+            raise
+        except Exception:
+            metrics.inc('pages_failed')
+            raise
+        finally:
+            if profiler.enabled:
+                profiler.merge_parts('convert_all workers')
+        pages.close()
+        return len(page_paths)
+
+    def ftmap(stage, results):
+        if summary_md in resumed:
+            summary = resume_page(summary_md)
+        else:
+            try:
+                summary = convert_file_indexed(processed_folder, summary_md, minify, False)
+            except Exception:
+                metrics.inc('pages_failed')
+                raise
+            journal.record(summary_md, summary)
+        index_page(summary)
+        metrics.inc('pages_converted')
+        metrics.inc('bytes_out', os.path.getsize(summary['html_path']))
+        FTMapGenerator(processed_folder, title=config['fluid_topics']['publication_title']).generate()
+        return [summary['html_path'], ftmap_path]
+
+    def page_targets(page):
+        targets = (link_index.target(page, url)[0] for url in link_index.links.get(page, ()))
+        return [target for target in targets if target]
+
+    def archive(stage, results):
+        # Parts are cut along the FTMAP, so they are written once it exists
+        zip_archive = None if config['archive_max_mb'] else zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED)
+        ready = set(asset_names)
+        packed = set()
+
+        # A file is packed once it exists and the TOC reaches it; pages reached
+        # before they are converted are packed when they arrive
+        def pack(names):
+            for name in names:
+                if name in ready and name not in packed and (reachability is None or name in reachability.reached):
+                    packed.add(name)
+                    if zip_archive is not None:
+                        zip_archive.write(files[name], name)
+
+        try:
+            pack(asset_names)
+            for html_path in stage.inputs['pages']:
+                page = link_index.page_name(html_path)
+                ready.add(page)
+                reached = reachability.add_links(page, page_targets(page)) if reachability else []
+                pack([page, *reached])
+                metrics.inc('pages_converted')
+                metrics.inc('bytes_out', os.path.getsize(html_path))
+        except BaseException:
+            if zip_archive is not None:
+                zip_archive.close()
+            raise
+
+        if reachability:
+            excluded = [(name, os.path.getsize(files[name])) for name in sorted(ready - packed)]
+            metrics.set('excluded_files', len(excluded))
+            metrics.set('excluded_bytes', sum(size for _, size in excluded))
+            for line in excluded_report(excluded):
+                logger.info(line)
+        return zip_archive, packed
+
+    def seal(stage, results):
+        if config['archive_max_mb']:
+            summary_html, ftmap_path = results['ftmap']
+            _, packed = results['archive']
+            splitter = ArchiveSplitter(processed_folder, link_index, config['archive_max_mb'] * 2**20)
+            archives = splitter.write(ftmap_path, sorted(packed), os.path.splitext(zip_file)[0],
+                                      extra_files=[link_index.page_name(summary_html)])
+        else:
+            zip_archive, _ = results['archive']
+            with zip_archive:
+                for path in results['ftmap']:
+                    zip_archive.write(path, os.path.relpath(path, processed_folder))
+            archives = [zip_file]
+
+        uncompressed_bytes = 0
+        for path in archives:
+            with zipfile.ZipFile(path) as zip_archive:
+                uncompressed_bytes += sum(info.file_size for info in zip_archive.infolist())
+        metrics.set('archive_parts', len(archives))
+        metrics.set('archive_uncompressed_bytes', uncompressed_bytes)
+        metrics.set('archive_bytes', sum(os.path.getsize(path) for path in archives))
+        return archives
+
+    def links(stage, results):
+        broken = link_index.validate()
+        report_path = write_report(config['link_report'], link_index, broken)
+        metrics.set('links_checked', link_index.link_count())
+        metrics.set('broken_links', len(broken))
+        for link in broken:
+            logger.warning(f"Broken link in {link}")
+        logger.info(f"Checked {link_index.link_count()} links in {len(link_index.pages)} pages, "
+                    f"{len(broken)} broken; report written to {report_path}")
+        if broken and config['broken_links'] == 'fail':
+            raise RuntimeError(f"{len(broken)} broken links, see {report_path}")
+        return len(broken)
+
+    def upload(stage, results):
+        ft_client = FluidTopicsClient(config['fluid_topics'])
+        archives = results['seal']
+        try:
+            uploaded = ft_client.upload(archives[0]) if len(archives) == 1 else ft_client.upload_parts(archives)
+            if not uploaded:
+                raise RuntimeError("Failed to upload to Fluid Topics")
+        finally:
+            metrics.set('upload_bytes', ft_client.uploaded_bytes)
+            metrics.set('upload_seconds', round(ft_client.upload_seconds, 3))
+            metrics.set('retries', ft_client.retries)
+        return True
+
+    # Profiles are named after the steps of the original sequential flow
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('convert', profiler.wrap('convert_all', convert))
+    scheduler.add_stage('ftmap', profiler.wrap('generate', ftmap))
+    scheduler.add_stage('archive', profiler.wrap('zip', archive))
+    scheduler.add_channel('pages', producer='convert', consumer='archive')
+    scheduler.add_stage('seal', profiler.wrap('seal', seal), deps=['archive', 'ftmap'])
+    scheduler.add_stage('links', profiler.wrap('validate_links', links), deps=['archive', 'ftmap'])
+    scheduler.add_stage('upload', profiler.wrap('upload', upload), deps=['seal', 'links'])
+    return scheduler
+
+def record_run(metrics, scheduler, success, metrics_file):
+    if scheduler is not None:
+        for stage, timing in scheduler.report()['stages'].items():
+            metrics.set_stage_seconds(stage, timing['duration'])
+    # Counters that were never incremented are still reported, as 0
+    for name in ('pages_converted', 'pages_failed', 'pages_resumed', 'retries', 'cache_hits', 'cache_misses'):
+        metrics.set(name, metrics.get(name))
+    skipped = metrics.get('pages_total') - metrics.get('pages_converted') - metrics.get('pages_failed')
+    metrics.set('pages_skipped', max(0, skipped))
+    metrics.finish(success)
+    try:
+        json_path, prometheus_path = metrics.write(metrics_file)
+        logger.info(f"Run metrics written to {json_path} and {prometheus_path}")
+    except OSError as e:
+        logger.error(f"Could not write run metrics: {e}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Convert a GitBook folder and publish it to Fluid Topics.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its journal instead of refusing to start")
+    args = parser.parse_args()
+
+    metrics = RunMetrics()
+    scheduler = None
+    success = False
+    config = None
+    journal = None
     try:
         config = load_config()
 
@@ -30,26 +345,37 @@ def main():
         # processed_folder = gitbook_processor.process()
         processed_folder = config['gitbook_repo_folder']
 
-        # Convert to HTML
-        html_converter = HTMLConverter(processed_folder)
-        html_converter.convert_all()
+        # The journal of the pages converted so far lets an interrupted run be resumed
+        journal = ConversionJournal(config['journal_file'] or journal_path(processed_folder), processed_folder)
+        if journal.exists():
+            if not args.resume:
+                raise RuntimeError(f"{journal.path} holds the pages of an interrupted run and {processed_folder} "
+                                   f"is partly converted; run again with --resume to continue it")
+            logger.info(f"Resuming from {journal.path}: {len(journal.load())} pages already converted")
+        elif args.resume:
+            logger.info(f"No journal at {journal.path}, starting from the beginning")
+        partial = remove_partial_writes(processed_folder)
+        if partial:
+            logger.info(f"Removed {partial} partially written pages")
 
-        # Generate FTMAP
-        ftmap_generator = FTMapGenerator(processed_folder, title=config['fluid_topics']['publication_title'])
-        ftmap_generator.generate()
-
-        # Create ZIP archive
-        zip_file = create_zip_archive(processed_folder)
-
-        # Upload to Fluid Topics
-        ft_client = FluidTopicsClient(config['fluid_topics'])
-        if not ft_client.upload(zip_file):
-            logger.error("Failed to upload to Fluid Topics")
-            sys.exit(1)  # Exit with non-zero code
+        # Convert to HTML, generate the FTMAP, create the ZIP archive and upload to Fluid Topics
+        profiler = Profiler(config['profile_dir'], enabled=bool(config['profile_dir']))
+        scheduler = build_pipeline(processed_folder, config, metrics, profiler, journal)
+        try:
+            scheduler.run()
+        finally:
+            scheduler.log_report()
 
+        journal.remove()
         logger.info("Migration completed successfully.")
+        success = True
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+    finally:
+        if journal is not None:
+            journal.close()
+        record_run(metrics, scheduler, success, config['metrics_file'] if config else 'run_metrics')
+    if not success:
         sys.exit(1)  # Exit with non-zero code on any exception
         
 if __name__ == "__main__":
@@ -2,6 +2,7 @@ import os
 import re
 import yaml
 import shutil
+from reachability import excluded_report, package_reachable
 
 def parse_summary_to_hierarchy(summary_lines, base_folder):
     """
@@ -107,12 +108,49 @@ def generate_toc_yaml(input_folder, summary_path, publication_title):
     return toc_path
 
 
-def create_zip_file(input_folder, output_name="documentation"):
+def resolve_includes_in_markdown(input_folder, include_cache):
+    """
+    Replaces GitBook {% include %} lines in every page of toc.yml with the included
+    Markdown. Each snippet is expanded once, however many pages include it.
+    """
+    toc_file = os.path.join(input_folder, "toc.yml")
+
+    with open(toc_file, "r") as toc:
+        toc_data = yaml.safe_load(toc)
+
+    def extract_paths(entries):
+        paths = []
+        for entry in entries:
+            path = entry.get("filepath")
+            if path and path.endswith(".md"):
+                paths.append(os.path.join(input_folder, path))
+            if "children" in entry:
+                paths.extend(extract_paths(entry["children"]))
+        return paths
+
+    for md_file in extract_paths(toc_data.get("toc", [])):
+        with open(md_file, 'r', encoding="utf-8") as file:
+            content = file.read()
+        updated_content = include_cache.expand(content, md_file)
+        if updated_content != content:
+            with open(md_file, 'w', encoding="utf-8") as file:
+                file.write(updated_content)
+    return include_cache.stats()
+
+
+def create_zip_file(input_folder, output_name="documentation", prune=True):
     """
     Creates a ZIP file from the input folder for Fluid Topics.
+
+    With prune, only toc.yml and what it reaches through page links and images are
+    packaged, leaving out .git, earlier archives and unused assets.
     """
     zip_file = os.path.join(input_folder, f"{output_name}.zip")
-    shutil.make_archive(zip_file.replace(".zip", ""), "zip", input_folder)
+    if not prune:
+        shutil.make_archive(zip_file.replace(".zip", ""), "zip", input_folder)
+        return zip_file
+    excluded = package_reachable([("", input_folder)], "toc.yml", zip_file)
+    print("\n".join(excluded_report(excluded)))
     return zip_file
 
 
@@ -372,7 +410,22 @@ def rename_space_to_dash(relative_path):
 
 
 
-def fix_header_2_3_and_newline_backslash(input_folder: str):
+def fix_header_2_3_and_newline_backslash(input_folder: str, header_mode: str = "inline"):
+    """
+    Rewrites H2-H6 headers and GitBook newline backslashes in every TOC page.
+
+    Args:
+        input_folder (str): Folder containing toc.yml and the Markdown pages.
+        header_mode (str): "inline" repeats the header style on every heading,
+            "stylesheet" emits class names and writes one shared stylesheet.
+
+    Returns:
+        int: Bytes saved by the stylesheet mode compared to inline styles
+            (0 in inline mode).
+    """
+    if header_mode not in ("inline", "stylesheet"):
+        raise ValueError(f"Unknown header mode: {header_mode}")
+
     toc_file = os.path.join(input_folder, "toc.yml")
 
     # Load TOC to get Markdown file paths
@@ -392,19 +445,34 @@ def fix_header_2_3_and_newline_backslash(input_folder: str):
 
     md_files = extract_paths(toc_data.get("toc", []))
 
+    saved_bytes = 0
+    if header_mode == "stylesheet":
+        stylesheet_path = write_header_stylesheet(input_folder)
+        saved_bytes -= os.path.getsize(stylesheet_path)
+
     for md_file in md_files:
         with open(md_file, 'r', encoding="utf-8") as file:
             content = file.read()
 
         # Apply replace_headings_with_bold to modify H2 and H3 headers
         # updated_content = replace_headings_with_bold(content)
-        updated_content = convert_headers_to_inline_styles(content)
+        inline_content = convert_headers_to_inline_styles(content)
+        if header_mode == "stylesheet":
+            updated_content = convert_headers_to_classes(content)
+            if updated_content != content:
+                link = os.path.relpath(stylesheet_path, os.path.dirname(md_file)).replace("\\", "/")
+                updated_content = f'<link rel="stylesheet" href="{link}">\n\n' + updated_content
+            saved_bytes += len(inline_content.encode("utf-8")) - len(updated_content.encode("utf-8"))
+        else:
+            updated_content = inline_content
         updated_content = convert_gitbook_to_standard_markdown_newline(updated_content)
 
         # Save the modified content back to the file
         with open(md_file, 'w', encoding="utf-8") as file:
             file.write(updated_content)
 
+    return saved_bytes
+
 
 # def replace_headings_with_bold(input_text):
 #     # Match any heading from H2 (##) onwards, but only add bold formatting if not already bolded
@@ -432,15 +500,46 @@ header_styles = {
     6: "font-size: 1.1em; font-weight: 600; font-family: 'Open Sans', sans-serif; padding-top: 3px; color: #414857;",
 }
 
+default_header_style = "font-size: 1.2em; font-weight: 600; font-family: 'Open Sans', sans-serif; color: #414857;"
+
+# Regex pattern to match Markdown headers (##, ###, ####, etc.)
+header_pattern = re.compile(r'^(#{2,6})\s*\*?(.*?)\*?$', flags=re.MULTILINE)
+
+HEADER_STYLESHEET = "header-styles.css"
+
 def convert_headers_to_inline_styles(content):
     def replace_heading(match):
         level = len(match.group(1))  # Determine header level based on number of '#'
         text = match.group(2).strip('* ')  # Remove extra spaces and asterisks (bold markers)
-        style = header_styles.get(level, "font-size: 1.2em; font-weight: 600; font-family: 'Open Sans', sans-serif; color: #414857;")  
+        style = header_styles.get(level, default_header_style)
         return f'<span style="{style}">{text}</span>'
 
-    # Regex pattern to match Markdown headers (##, ###, ####, etc.)
-    return re.sub(r'^(#{2,6})\s*\*?(.*?)\*?$', replace_heading, content, flags=re.MULTILINE)
+    return header_pattern.sub(replace_heading, content)
+
+def header_class(level):
+    return f"ft-h{level}"
+
+def convert_headers_to_classes(content):
+    """
+    Same rewrite as convert_headers_to_inline_styles, but the span only carries
+    a class name; the styles live once in the shared stylesheet.
+    """
+    def replace_heading(match):
+        level = len(match.group(1))
+        text = match.group(2).strip('* ')
+        return f'<span class="{header_class(level)}">{text}</span>'
+
+    return header_pattern.sub(replace_heading, content)
+
+def build_header_stylesheet():
+    rules = [f"span.{header_class(level)} {{ {style} }}" for level, style in sorted(header_styles.items())]
+    return "\n".join(rules) + "\n"
+
+def write_header_stylesheet(input_folder):
+    stylesheet_path = os.path.join(input_folder, HEADER_STYLESHEET)
+    with open(stylesheet_path, 'w', encoding="utf-8") as file:
+        file.write(build_header_stylesheet())
+    return stylesheet_path
 
 def convert_gitbook_to_standard_markdown_newline(text):
     # Replace backslashes at end of lines with two spaces
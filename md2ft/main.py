@@ -1,5 +1,12 @@
 import os
-from converter import generate_toc_yaml, create_zip_file, fix_relative_images_in_markdown, fix_header_2_3_and_newline_backslash
+import sys
+
+# profiling.py, includes.py and reachability.py live in the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from converter import (generate_toc_yaml, create_zip_file, fix_relative_images_in_markdown,
+                       fix_header_2_3_and_newline_backslash, resolve_includes_in_markdown)
+from profiling import Profiler
+from includes import MarkdownIncludeCache
 
 
 def main():
@@ -17,20 +24,39 @@ def main():
     if not os.path.exists(summary_path):
         raise FileNotFoundError(f"Summary.md not found in {input_folder}")
 
+    # PROFILE_DIR=<folder> writes a CPU, allocation and flame graph profile per step
+    profile_dir = os.getenv("PROFILE_DIR")
+    profiler = Profiler(profile_dir, enabled=bool(profile_dir))
+
     # Step 1: Process Summary.md and create toc.yml
-    toc_path = generate_toc_yaml(input_folder, summary_path, publication_title)
+    with profiler.stage("generate_toc_yaml"):
+        toc_path = generate_toc_yaml(input_folder, summary_path, publication_title)
     print(f"Generated toc.yml at {toc_path}")
 
+    # Inline GitBook includes before the other passes rewrite the pages
+    with profiler.stage("resolve_includes"):
+        hits, misses = resolve_includes_in_markdown(input_folder, MarkdownIncludeCache())
+    print(f"Resolved includes: {misses} snippets expanded, {hits} reused.")
+
     # Step 2: Fix images in Markdown
-    fix_relative_images_in_markdown(input_folder)
+    with profiler.stage("fix_relative_images"):
+        fix_relative_images_in_markdown(input_folder)
     print(f"Successfuly fixed relative images issue.")
 
     # # Step 3: Fix H2, H3 images in Markdown
-    fix_header_2_3_and_newline_backslash(input_folder)
+    # HEADER_STYLE_MODE=stylesheet emits class names plus one shared header-styles.css
+    header_mode = os.getenv("HEADER_STYLE_MODE", "inline")
+    with profiler.stage("fix_headers"):
+        saved_bytes = fix_header_2_3_and_newline_backslash(input_folder, header_mode)
     print(f"Successfuly fixed headers.")
+    if header_mode == "stylesheet":
+        print(f"Shared header stylesheet saved {saved_bytes} bytes compared to inline styles.")
 
     # Step 3: Create a ZIP file
-    zip_path = create_zip_file(input_folder)
+    # PRUNE_UNREACHABLE=0 packages the whole folder instead of what toc.yml reaches
+    prune = os.getenv("PRUNE_UNREACHABLE", "1") != "0"
+    with profiler.stage("zip"):
+        zip_path = create_zip_file(input_folder, prune=prune)
     print(f"Created ZIP file at {zip_path}")
 
 
@@ -0,0 +1,206 @@
+import os
+import re
+import errno
+import shutil
+import hashlib
+from pathlib import Path
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp", ".ico", ".tif", ".tiff"}
+
+# Linux FICLONE ioctl: share the source file's extents (btrfs, XFS, overlayfs on those, ...)
+FICLONE = 0x40049409
+
+STAGING_STRATEGIES = ("auto", "reflink", "hardlink", "copy", "inplace")
+
+# errno values meaning "this filesystem / device pair cannot do it", as opposed to a real I/O error
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY, errno.EMLINK,
+                      getattr(errno, "EOPNOTSUPP", errno.EINVAL), getattr(errno, "ENOTSUP", errno.EINVAL)}
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicate_images(assets_folder, workers=None):
+    """
+    Hashes every image under assets_folder in parallel and groups identical ones.
+
+    Returns:
+        dict: Duplicate image path -> canonical image path. The canonical copy of
+            each group is the one with the shortest (then alphabetically first) name,
+            so "image.png" wins over "image (1).png".
+    """
+    images = [
+        path for path in Path(assets_folder).rglob("*")
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    ]
+
+    # Only files of equal size can be identical, so skip hashing unique sizes
+    by_size = {}
+    for path in images:
+        by_size.setdefault(path.stat().st_size, []).append(path)
+    candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(hash_file, candidates))
+
+    groups = {}
+    for path, digest in zip(candidates, digests):
+        groups.setdefault(digest, []).append(path)
+
+    duplicates = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        group.sort(key=lambda path: (len(path.name), path.name))
+        for path in group[1:]:
+            duplicates[path] = group[0]
+    return duplicates
+
+
+def rewrite_asset_references(pages_folder, assets_folder, duplicates, extensions=(".md", ".html")):
+    """
+    Points every reference to a duplicate image at its canonical copy.
+
+    References are matched by their path relative to the assets folder, both raw
+    ("assets/image (1).png") and URL-encoded ("assets/image%20(1).png").
+
+    Returns:
+        int: Number of pages that were rewritten.
+    """
+    if not duplicates:
+        return 0
+
+    assets_name = Path(assets_folder).name
+    replacements = {}
+    for duplicate, canonical in duplicates.items():
+        duplicate_rel = duplicate.relative_to(assets_folder).as_posix()
+        canonical_rel = canonical.relative_to(assets_folder).as_posix()
+        # Raw, pandoc-style (spaces only) and fully URL-encoded spellings
+        for encode in (str, lambda path: quote(path, safe="/()"), quote):
+            replacements[f"{assets_name}/{encode(duplicate_rel)}"] = f"{assets_name}/{encode(canonical_rel)}"
+
+    # Longest first so the most specific reference wins when spellings overlap. A match
+    # must be a whole path segment: "assets/a.png" leaves "my-assets/a.png" and
+    # "assets/a.png.bak" alone, while "../.gitbook/assets/a.png" still matches
+    alternatives = "|".join(re.escape(ref) for ref in sorted(replacements, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![\w.%-])(?:{alternatives})(?![\w.%-])")
+
+    rewritten = 0
+    for page in Path(pages_folder).rglob("*"):
+        if page.suffix not in extensions or not page.is_file():
+            continue
+        with open(page, "r", encoding="utf-8") as file:
+            content = file.read()
+        updated_content = pattern.sub(lambda match: replacements[match.group(0)], content)
+        if updated_content != content:
+            with open(page, "w", encoding="utf-8") as file:
+                file.write(updated_content)
+            rewritten += 1
+    return rewritten
+
+
+def dedupe_assets(output_folder, workers=None, gitbook_folder=None):
+    """
+    Keeps one canonical copy of each unique image in .gitbook/assets and rewrites
+    the converted pages in output_folder to use the canonical copy.
+
+    Args:
+        gitbook_folder (str): The .gitbook folder to scan. Defaults to the staged
+            <output_folder>/.gitbook, whose duplicates are deleted. When it points at
+            the source folder (assets referenced in place), nothing is deleted and the
+            duplicates are returned for the archive builder to leave out.
+
+    Returns:
+        dict: Number of removed files, rewritten pages, bytes removed and the set of
+            duplicate paths ("duplicates").
+    """
+    in_place = gitbook_folder is not None
+    assets_folder = Path(gitbook_folder or Path(output_folder) / ".gitbook") / "assets"
+    if not assets_folder.is_dir():
+        return {"removed_files": 0, "rewritten_pages": 0, "removed_bytes": 0, "duplicates": set()}
+
+    duplicates = find_duplicate_images(assets_folder, workers)
+    rewritten = rewrite_asset_references(output_folder, assets_folder, duplicates)
+
+    removed_bytes = 0
+    for duplicate in duplicates:
+        removed_bytes += duplicate.stat().st_size
+        if not in_place:
+            os.remove(duplicate)
+
+    return {"removed_files": len(duplicates), "rewritten_pages": rewritten, "removed_bytes": removed_bytes,
+            "duplicates": set(duplicates)}
+
+
+def reflink_file(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def stage_tree(src, dst, strategy="auto"):
+    """
+    Stages the src folder at dst without copying bytes where the filesystem allows it.
+
+    "auto" tries a reflink (copy-on-write clone) for each file, then a hardlink, and
+    falls back to a plain copy. Once a method is unsupported between src and dst it is
+    not tried again for the remaining files. "reflink", "hardlink" and "copy" force a
+    single method. Staged files must not be modified in place: a hardlink shares its
+    bytes with the source. A file already at dst, for instance a hardlink staged by an
+    earlier run, is unlinked before its replacement is staged, never written through.
+
+    Returns:
+        dict: Number of files staged with each method.
+    """
+    if strategy not in ("auto", "reflink", "hardlink", "copy"):
+        raise ValueError(f"Unknown staging strategy: {strategy}")
+
+    methods = {
+        "reflink": reflink_file,
+        "hardlink": os.link,
+        "copy": shutil.copy2,
+    }
+    enabled = ["reflink", "hardlink", "copy"] if strategy == "auto" else [strategy]
+    counts = {method: 0 for method in methods}
+
+    def stage_file(source, target):
+        try:
+            os.unlink(target)
+        except FileNotFoundError:
+            pass
+        for method in list(enabled):
+            try:
+                methods[method](source, target)
+            except OSError as e:
+                if method == "copy" or e.errno not in UNSUPPORTED_ERRNOS or len(enabled) == 1:
+                    raise
+                enabled.remove(method)
+                continue
+            counts[method] += 1
+            return target
+        raise OSError(errno.EOPNOTSUPP, f"Could not stage {source}")
+
+    shutil.copytree(src, dst, copy_function=stage_file, dirs_exist_ok=True)
+    return counts
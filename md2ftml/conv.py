@@ -1,56 +1,153 @@
 import os
 import re
+import sys
+import zipfile
 import subprocess
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import summary
-import shutil
+import assets
+from git_metadata import build_history_index
 
-def convert_gitbook_to_fluid(input_folder, output_folder):
+# includes.py and reachability.py live in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from includes import MarkdownIncludeCache, markdown_pages
+from reachability import archive_files, excluded_report, reachable_files
+
+PANDOC_COMMAND = [
+    "pandoc",
+    "--from=gfm",
+    "--to=html", #markdown",
+    "--wrap=none",
+    "--lua-filter=" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "fix_folder_links.lua"),
+]
+
+# Separates documents batched into a single pandoc run; fix_folder_links.lua treats
+# every document after a marker exactly like the first one of a single-document run.
+BATCH_SPLIT = "<!-- ft-batch-split -->"
+# pandoc writes a blank line after the marker, which a single document's output never starts with
+BATCH_SPLIT_PATTERN = re.compile(r"^" + re.escape(BATCH_SPLIT) + r"\n*", flags=re.MULTILINE)
+
+# Reference definitions and footnotes are document-global in Markdown, so pages that
+# use them would resolve each other's labels when concatenated.
+UNBATCHABLE_PATTERN = re.compile(r"^ {0,3}\[[^\]]+\]:|\[\^", flags=re.MULTILINE)
+
+
+class PandocError(RuntimeError):
+    pass
+
+
+def run_pandoc(content, source):
+    """
+    Runs pandoc on content and returns its output, raising PandocError on failure.
+    """
+    try:
+        result = subprocess.run(PANDOC_COMMAND, input=content.encode(), capture_output=True)
+    except OSError as e:
+        raise PandocError(f"Could not start pandoc for {source}: {e}") from e
+    stderr = result.stderr.decode(errors="replace").strip()
+    if result.returncode != 0:
+        raise PandocError(f"pandoc failed on {source} (exit code {result.returncode}): {stderr}")
+    if stderr:
+        tqdm.write(f"⚠️ pandoc warnings for {source}: {stderr}")
+    return result.stdout.decode()
+
+
+def is_batchable(content):
+    return bool(content.strip()) and BATCH_SPLIT not in content and not UNBATCHABLE_PATTERN.search(content)
+
+
+def convert_batch(batch):
+    """
+    Converts a list of (md_file, content) pairs, in one pandoc run when there is more
+    than one document. If the output cannot be split back into exactly one part per
+    document, every document is converted on its own instead.
+
+    Returns:
+        list of str: The converted content of each document, in order.
+    """
+    if len(batch) == 1:
+        md_file, content = batch[0]
+        return [run_pandoc(content, md_file)]
+
+    combined = f"\n\n{BATCH_SPLIT}\n\n".join(content for _, content in batch)
+    sources = ", ".join(str(md_file) for md_file, _ in batch)
+    parts = BATCH_SPLIT_PATTERN.split(run_pandoc(combined, sources))
+    if len(parts) == len(batch):
+        return parts
+    return [run_pandoc(content, md_file) for md_file, content in batch]
+
+
+def make_batches(md_files, batch_size, include_cache=None):
+    """
+    Reads the Markdown files, expanding GitBook includes if an include_cache is given,
+    and groups the batchable ones into lists of up to batch_size documents; every
+    other document gets a batch of its own.
+    """
+    batches = []
+    current = []
+    for md_file in md_files:
+        with open(md_file, "r", encoding="utf-8") as file:
+            content = file.read()
+        if include_cache is not None:
+            content = include_cache.expand(content, str(md_file))
+        if batch_size <= 1 or not is_batchable(content):
+            batches.append([(md_file, content)])
+            continue
+        current.append((md_file, content))
+        if len(current) == batch_size:
+            batches.append(current)
+            current = []
+    if current:
+        batches.append(current)
+    return batches
+
+
+def convert_gitbook_to_fluid(input_folder, output_folder, workers=None, batch_size=1):
     """
     Converts all GitBook Markdown files in the input_folder to Fluid Topics-compatible Markdown.
     Uses Pandoc for format conversion and regex for syntax adjustments.
+
+    Pandoc runs in a pool of up to `workers` concurrent processes (default: one per
+    core), with up to `batch_size` documents per invocation.
     """
     input_path = Path(input_folder)
     output_path = Path(output_folder)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # Find all markdown files
-    md_files = list(input_path.rglob("*.md"))
+    # Find the pages: the same set the HTML converter converts, without include snippets
+    md_files = [Path(md_path) for md_path in markdown_pages(input_folder)]
+    include_cache = MarkdownIncludeCache()
+    batches = make_batches(md_files, batch_size, include_cache)
+    hits, misses = include_cache.stats()
+    if misses:
+        print(f"Resolved includes: {misses} snippets expanded, {hits} reused.")
 
-    for md_file in tqdm(md_files, desc="Processing Markdown Files"):
-        #print(f"Converting: {md_file}")
-        with open(md_file, "r", encoding="utf-8") as file:
-            content = file.read()
+    # Each worker thread only waits on its pandoc subprocess, so threads keep all cores busy
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(convert_batch, batch): batch for batch in batches}
+        with tqdm(total=len(md_files), desc="Processing Markdown Files") as progress:
+            try:
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    for (md_file, _), converted_content in zip(batch, future.result()):
+                        # Replace GitBook-specific syntax with Fluid Topics format
+                        converted_content = adjust_markdown_syntax(converted_content)
+
+                        # Save converted file in output folder
+                        relative_path = md_file.relative_to(input_path)
+                        output_file = output_path / relative_path
+                        #output_file = output_file.with_suffix(".html")
+                        output_file.parent.mkdir(parents=True, exist_ok=True)
 
-        #print(content)
-        #input("Press Enter to continue...")
-        # Convert GitBook Markdown to Fluid Topics Markdown using Pandoc
-        pandoc_command = [
-            "pandoc",
-            "--from=gfm",
-            "--to=html", #markdown",
-            "--wrap=none",
-            "--lua-filter=fix_folder_links.lua",
-        ]
-        result = subprocess.run(pandoc_command, input=content.encode(), capture_output=True)
-        converted_content = result.stdout.decode()
-        #print(result.stderr.decode())
-        #input("Press Enter to continue...")
-        #print(converted_content)
-        #input("Press Enter to continue...")
-
-        # Replace GitBook-specific syntax with Fluid Topics format
-        converted_content = adjust_markdown_syntax(converted_content)
-
-        # Save converted file in output folder
-        relative_path = md_file.relative_to(input_path)
-        output_file = output_path / relative_path
-        #output_file = output_file.with_suffix(".html")
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(output_file, "w", encoding="utf-8") as file:
-            file.write(converted_content)
+                        with open(output_file, "w", encoding="utf-8") as file:
+                            file.write(converted_content)
+                    progress.update(len(batch))
+            except PandocError:
+                for pending in futures:
+                    pending.cancel()
+                raise
 
 def adjust_markdown_syntax(content):
     """
@@ -75,12 +172,27 @@ def adjust_markdown_syntax(content):
 
     return content
 
-def create_zip_file(input_folder, output_name="documentation"):
+def create_zip_file(input_folder, output_name="documentation", extra_folders=None, exclude=(), prune=True):
     """
     Creates a ZIP file from the input folder for Fluid Topics.
+
+    extra_folders maps an archive folder name to a folder on disk whose files are
+    read in place (e.g. {".gitbook": "<docs>/.gitbook"}), so they never need to be
+    staged into input_folder. Files listed in exclude are left out. With prune, only
+    Summary.ftmap and what it reaches through page links and images are packaged.
     """
     zip_file = os.path.join(input_folder, f"{output_name}.zip")
-    shutil.make_archive(zip_file.replace(".zip", ""), "zip", input_folder)
+    folders = [("", input_folder)] + list((extra_folders or {}).items())
+    exclude = [*exclude, zip_file]
+
+    if prune:
+        entries, excluded = reachable_files(folders, "Summary.ftmap", exclude=exclude)
+        print("\n".join(excluded_report(excluded)))
+    else:
+        entries = sorted(archive_files(folders, exclude).items())
+    with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as archive:
+        for arcname, path in entries:
+            archive.write(path, arcname)
     return zip_file
 
 if __name__ == "__main__":
@@ -91,19 +203,57 @@ if __name__ == "__main__":
     
     PUBLICATION_TITLE = os.getenv('PUBLICATION_TITLE')
 
+    PANDOC_WORKERS = int(os.getenv("PANDOC_WORKERS", "0")) or None
+    PANDOC_BATCH_SIZE = int(os.getenv("PANDOC_BATCH_SIZE", "1"))
+
     print(f"Coverting MD to html...")
-    convert_gitbook_to_fluid(input_folder, output_folder)
+    try:
+        convert_gitbook_to_fluid(input_folder, output_folder, PANDOC_WORKERS, PANDOC_BATCH_SIZE)
+    except PandocError as e:
+        raise SystemExit(f"❌ {e}")
     print(f"Done.")
 
+    # GIT_METADATA=0 skips the last-modified and contributors metas read from git history
+    git_metadata = None
+    if os.getenv("GIT_METADATA", "1") != "0":
+        print(f"Reading git history...")
+        git_metadata = build_history_index(input_folder)
+        print(f"Found history for {len(git_metadata)} files.")
+
     print(f"Creating Summary toc...")
-    summary.create_summary(input_folder, output_folder, PUBLICATION_TITLE)
+    summary.create_summary(input_folder, output_folder, PUBLICATION_TITLE, git_metadata)
     print(f"Done.")
 
-    print(f"Copying .gitbook folder...")
-    shutil.copytree(input_folder + "/.gitbook", output_folder + "/.gitbook")
+    # ASSET_STAGING: auto (reflink, then hardlink, then copy), reflink, hardlink, copy,
+    # or inplace to let the ZIP builder read .gitbook straight from DOCS_FOLDER
+    ASSET_STAGING = os.getenv("ASSET_STAGING", "auto")
+    if ASSET_STAGING not in assets.STAGING_STRATEGIES:
+        raise SystemExit(f"❌ Unknown ASSET_STAGING '{ASSET_STAGING}', expected one of {assets.STAGING_STRATEGIES}")
+    gitbook_folder = input_folder + "/.gitbook"
+
+    if ASSET_STAGING == "inplace":
+        print(f"Referencing .gitbook folder in place...")
+        staged_gitbook = None
+    else:
+        print(f"Staging .gitbook folder...")
+        staged = assets.stage_tree(gitbook_folder, output_folder + "/.gitbook", ASSET_STAGING)
+        staged_gitbook = output_folder + "/.gitbook"
+        print(f"Staged {staged['reflink']} reflinked, {staged['hardlink']} hardlinked and {staged['copy']} copied files.")
     print(f"Done.")
 
+    print(f"Deduplicating images...")
+    dedupe = assets.dedupe_assets(output_folder, gitbook_folder=None if staged_gitbook else gitbook_folder)
+    print(f"Removed {dedupe['removed_files']} duplicate images ({dedupe['removed_bytes']} bytes), "
+          f"rewrote references in {dedupe['rewritten_pages']} pages.")
+
+    # PRUNE_UNREACHABLE=0 packages every output file instead of what Summary.ftmap reaches
+    PRUNE_UNREACHABLE = os.getenv("PRUNE_UNREACHABLE", "1") != "0"
+
     print(f"Creating ZIP file...")
-    zip_path = create_zip_file(output_folder)
+    if staged_gitbook:
+        zip_path = create_zip_file(output_folder, prune=PRUNE_UNREACHABLE)
+    else:
+        zip_path = create_zip_file(output_folder, extra_folders={".gitbook": gitbook_folder},
+                                   exclude=dedupe["duplicates"], prune=PRUNE_UNREACHABLE)
     print(f"Created ZIP file at {zip_path}")
     print(f"\n✅ Conversion complete! Converted files saved to: {output_folder}")
@@ -49,6 +49,11 @@ end
 
 local first_block_removed = false
 
+-- conv.py may batch several documents into one pandoc run, separated by this marker
+local function is_batch_split(block)
+  return block.t == "RawBlock" and block.text:match("^%s*<!%-%- ft%-batch%-split %-%->%s*$") ~= nil
+end
+
 function Pandoc(doc)
   -- Check if the first block has been removed
   if not first_block_removed then
@@ -56,6 +61,15 @@ function Pandoc(doc)
     table.remove(doc.blocks, 1)
     first_block_removed = true
   end
+
+  -- Remove the first block of every batched document as well
+  local i = 1
+  while i < #doc.blocks do
+    if is_batch_split(doc.blocks[i]) and not is_batch_split(doc.blocks[i + 1]) then
+      table.remove(doc.blocks, i + 1)
+    end
+    i = i + 1
+  end
   return doc
 end
 
@@ -111,4 +125,11 @@ function Para(elem)
   return elem
 end
 
-
+function RawBlock(elem)
+  -- Never let an unclosed hint swallow the next batched document
+  if is_batch_split(elem) then
+    in_hint = false
+    collected_content = {}
+  end
+  return elem
+end
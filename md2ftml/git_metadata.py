@@ -0,0 +1,126 @@
+import os
+import subprocess
+from urllib.parse import unquote
+
+LAST_MODIFIED_KEY = "lastModified"
+CONTRIBUTORS_KEY = "contributors"
+
+# Commit headers start with a record separator so they can never be taken for a path
+COMMIT_MARKER = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+LOG_FORMAT = f"{COMMIT_MARKER}%H{FIELD_SEPARATOR}%cI{FIELD_SEPARATOR}%an"
+
+
+class FileHistory:
+    def __init__(self):
+        self.last_modified = None
+        self.commits = 0
+        self.authors = {}
+
+    def add(self, date, author):
+        # git log lists the newest commit first
+        if self.last_modified is None:
+            self.last_modified = date
+        self.commits += 1
+        self.authors[author] = self.authors.get(author, 0) + 1
+
+    def contributors(self):
+        return sorted(self.authors, key=lambda author: (-self.authors[author], author))
+
+    def metas(self):
+        return {LAST_MODIFIED_KEY: self.last_modified, CONTRIBUTORS_KEY: self.contributors()}
+
+
+class HistoryIndex:
+    """
+    Builds path -> FileHistory from the name-status lines of git log, newest commit
+    first. Renames are followed: changes made under an older name count for the path
+    the file has now. A path that was added, or deleted before HEAD, starts a new
+    file, so the history of an older file at the same path is not attributed to it.
+    """
+
+    def __init__(self):
+        self.files = {}
+        # Older path -> path at HEAD, or None when the older path is another file
+        self.aliases = {}
+
+    def current(self, path):
+        return self.aliases.get(path, path)
+
+    def record(self, path, date, author):
+        if path is not None:
+            self.files.setdefault(path, FileHistory()).add(date, author)
+
+    def change(self, fields, date, author):
+        status = fields[0][:1]
+        if status in ("R", "C") and len(fields) == 3:
+            old, new = fields[1], fields[2]
+            path = self.current(new)
+            self.record(path, date, author)
+            # A copy leaves the source file in place, with a history of its own
+            if status == "R":
+                self.aliases[old] = path
+            self.aliases[new] = None
+        elif status == "A":
+            self.record(self.current(fields[1]), date, author)
+            self.aliases[fields[1]] = None
+        elif status == "D":
+            self.aliases.setdefault(fields[1], None)
+        elif len(fields) == 2:
+            self.record(self.current(fields[1]), date, author)
+
+
+def git_log_lines(folder):
+    """
+    Streams one git log over the whole history of folder, with the files each commit
+    changed and paths relative to folder.
+    """
+    command = ["git", "-C", folder, "-c", "core.quotepath=off", "log", "--no-merges", "--name-status",
+               "-M", "--relative", f"--format={LOG_FORMAT}"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, encoding="utf-8", errors="replace")
+    try:
+        for line in process.stdout:
+            yield line.rstrip("\n")
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"git log failed in {folder}: {stderr.strip()}")
+
+
+def build_history_index(folder):
+    """
+    Returns path -> {lastModified, contributors} for every file under folder that
+    exists at HEAD, from a single pass over git log. Returns {} when folder is not in
+    a git repository.
+    """
+    try:
+        lines = git_log_lines(folder)
+        index = HistoryIndex()
+        date = author = None
+        for line in lines:
+            if line.startswith(COMMIT_MARKER):
+                _, date, author = line[len(COMMIT_MARKER):].split(FIELD_SEPARATOR, 2)
+            elif line:
+                index.change(line.split("\t"), date, author)
+    except (OSError, RuntimeError) as e:
+        print(f"Skipping git metadata: {e}")
+        return {}
+    return {path: history.metas() for path, history in index.files.items()
+            if os.path.exists(os.path.join(folder, path))}
+
+
+def merge_metadata(hrefs, git_metadata, metadata):
+    """
+    Returns href -> metas for the TOC hrefs, taking the git metadata of the page each
+    href names and letting the entries of metadata.yaml override them key by key.
+    """
+    merged = {}
+    for href in hrefs:
+        path = os.path.normpath(unquote(href.split("#", 1)[0])).replace(os.sep, "/")
+        values = {**git_metadata.get(path, {}), **metadata.get(href, {})}
+        if values:
+            merged[href] = values
+    return merged
@@ -1,7 +1,7 @@
+import os
 import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
 import yaml
-import pdb
+from git_metadata import merge_metadata
 
 
 def create_xml_node(ft_publication_title, title, href, children=None):
@@ -21,25 +21,39 @@ def create_xml_node(ft_publication_title, title, href, children=None):
             node.append(child)
     return node
 
-def parse_lines(ft_publication_title, lines, level=0):
+def parse_lines(ft_publication_title, lines, level=0, node_index=None):
+    """
+    Parses SUMMARY.md list lines into ft:node elements in a single forward pass.
+
+    Args:
+        lines (list of str): Lines of SUMMARY.md; the list is not modified.
+        node_index (dict): Optional href -> list of nodes index, filled while parsing.
+    """
+    nodes, _ = _parse_lines(ft_publication_title, lines, 0, level, node_index)
+    return nodes
+
+def _parse_lines(ft_publication_title, lines, position, level, node_index):
     nodes = []
-    while lines:
-        line = lines[0]
+    while position < len(lines):
+        line = lines[position]
         if '*' not in line:
-            lines.pop(0)
+            position += 1
             continue
         indent = len(line) - len(line.lstrip(" "))
         if indent < level:
             break
-        lines.pop(0)
+        position += 1
         parts = line.strip().split("](")
         title = parts[0].lstrip("* [")
         href = parts[1].rstrip(")")
-        children = parse_lines(ft_publication_title, lines, level + 2)
-        nodes.append(create_xml_node(ft_publication_title, title, href, children))
-    return nodes
+        children, position = _parse_lines(ft_publication_title, lines, position, level + 2, node_index)
+        node = create_xml_node(ft_publication_title, title, href, children)
+        if node_index is not None:
+            node_index.setdefault(href, []).append(node)
+        nodes.append(node)
+    return nodes, position
 
-def convert_to_xml(lines, ft_publication_title):
+def convert_to_xml(lines, ft_publication_title, node_index=None):
     root_node = ET.Element("ft:map", {"xmlns:ft": "http://ref.fluidtopics.com/v3/ft#",
                                       "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
                                       "xsi:noNamespaceSchemaLocation": "ftmap.xsd",
@@ -49,49 +63,94 @@ def convert_to_xml(lines, ft_publication_title):
                                         "ft:editorialType": "book"})
     toc_node = ET.Element("ft:toc")
     root_node.append(toc_node)
-    xml_nodes = parse_lines(ft_publication_title,lines)
+    xml_nodes = parse_lines(ft_publication_title, lines, node_index=node_index)
     for node in xml_nodes:
         toc_node.append(node)
     return ET.ElementTree(root_node)
 
 
-def pretty_print_xml(tree):
-    xml_str = ET.tostring(tree.getroot(), encoding='utf-8')
-    parsed_str = minidom.parseString(xml_str)
-    return "\n".join(parsed_str.toprettyxml(indent="\t").split("\n")[1:])
+def _escape(data):
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-def add_metadata(xml_tree, metadata):
-    # Iterate over nodes and update metadata
-    for element in xml_tree.iter():
-        if not element.tag.endswith("node"):
-            continue
-        node = element
-        href = node.get("href")
-        if href in metadata:
+def _escape_attribute(value):
+    return _escape(value).replace('"', "&quot;")
+
+def _write_element(element, out, depth, indent):
+    prefix = indent * depth
+    attributes = "".join(f' {key}="{_escape_attribute(value)}"' for key, value in element.attrib.items())
+    children = list(element)
+    if not children and not element.text:
+        out.append(f"{prefix}<{element.tag}{attributes}/>\n")
+    elif not children:
+        out.append(f"{prefix}<{element.tag}{attributes}>{_escape(element.text)}</{element.tag}>\n")
+    else:
+        out.append(f"{prefix}<{element.tag}{attributes}>\n")
+        for child in children:
+            _write_element(child, out, depth + 1, indent)
+        out.append(f"{prefix}</{element.tag}>\n")
+
+def pretty_print_xml(tree, indent="\t"):
+    """
+    Serializes the ftmap tree with the same layout as minidom's toprettyxml
+    (without the XML declaration), in a single pass over the tree.
+    """
+    out = []
+    _write_element(tree.getroot(), out, 0, indent)
+    return "".join(out)
+
+def add_metadata(xml_tree, metadata, node_index=None):
+    """
+    Attaches metadata.yaml entries to the nodes whose href they name. A list value
+    becomes one ft:meta per item, as Fluid Topics expects for multi-valued metadata.
+
+    Args:
+        node_index (dict): href -> list of nodes, as filled by convert_to_xml.
+            Built from the tree when not given.
+    """
+    if node_index is None:
+        node_index = {}
+        for element in xml_tree.iter():
+            if element.tag.endswith("node") and element.get("href") is not None:
+                node_index.setdefault(element.get("href"), []).append(element)
+
+    for href, values in metadata.items():
+        for node in node_index.get(href, []):
             metas_elem = node.find("ft:metas")
             if metas_elem is None:
                 metas_elem = ET.SubElement(node, "ft:metas")
 
-            for key, value in metadata[href].items():
-                meta_elem = ET.SubElement(metas_elem, "ft:meta")
-                meta_elem.set("key", key)
-                meta_elem.text = value
+            for key, value in values.items():
+                for item in value if isinstance(value, list) else [value]:
+                    meta_elem = ET.SubElement(metas_elem, "ft:meta")
+                    meta_elem.set("key", key)
+                    meta_elem.text = str(item)
 
-def create_summary(input_folder, output_folder, ft_publication_title):
+def create_summary(input_folder, output_folder, ft_publication_title, git_metadata=None):
     """
     Creates a summary file for the converted content.
+
+    Args:
+        git_metadata (dict): Page path -> metas from build_history_index; entries of
+            metadata.yaml override it key by key.
     """
     # Read the original summary file
     with open(input_folder + "/SUMMARY.md", "r", encoding="utf-8") as file:
         lines = file.readlines()
 
     # Convert the summary file to Fluid Topics format
-    xml_tree = convert_to_xml(lines, ft_publication_title)
+    node_index = {}
+    xml_tree = convert_to_xml(lines, ft_publication_title, node_index)
 
     # add metadata
-    with open(input_folder + "/metadata.yaml", "r") as file:
-        metadata = yaml.safe_load(file).get("metadata", {})
-        add_metadata(xml_tree, metadata)
+    metadata = {}
+    metadata_path = input_folder + "/metadata.yaml"
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as file:
+            metadata = yaml.safe_load(file).get("metadata", {})
+    if git_metadata:
+        metadata = merge_metadata(set(node_index) | set(metadata), git_metadata, metadata)
+    if metadata:
+        add_metadata(xml_tree, metadata, node_index)
 
     # buitify the xml
     pretty_xml = pretty_print_xml(xml_tree)
@@ -0,0 +1,135 @@
+import logging
+import resource
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+# Lower bound on the working memory a page needs per byte of Markdown
+MIN_BYTES_PER_SOURCE_BYTE = 64
+
+
+def read_status_bytes(field):
+    try:
+        with open('/proc/self/status', 'r') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    rss = read_status_bytes('VmRSS')
+    if rss is None:
+        # No /proc: fall back to the peak, which is the best upper bound available
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+)
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class PeakMemory:
+    """
+    Measures the peak memory of the current process while the block runs.
+
+    Uses the kernel's resettable RSS high-water mark where available; elsewhere falls
+    back to tracemalloc, which only sees Python allocations and slows the block down.
+    """
+
+    def __enter__(self):
+        self.base_bytes = current_rss()
+        self.use_tracemalloc = not reset_peak_rss()
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.use_tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak_bytes = self.base_bytes + peak
+        else:
+            self.peak_bytes = read_status_bytes('VmHWM')
+        return False
+
+
+class MemoryBudget:
+    """
+    Admits pages for conversion while the estimated resident memory of the run stays
+    under budget_bytes.
+
+    The estimate is the RSS of the main process, plus the largest idle RSS seen per
+    worker, plus the working memory of every page in flight. Page working memory is
+    predicted from its source size with the highest memory-per-source-byte ratio
+    observed so far (never below MIN_BYTES_PER_SOURCE_BYTE).
+    """
+
+    def __init__(self, budget_bytes, workers):
+        self.budget_bytes = budget_bytes
+        self.workers = workers
+        self.worker_base_bytes = 0
+        self.bytes_per_source_byte = MIN_BYTES_PER_SOURCE_BYTE
+        self.in_flight = 0
+        self.peak_estimate = 0
+
+    def estimate(self, source_bytes):
+        return max(1, source_bytes) * self.bytes_per_source_byte
+
+    def committed(self):
+        return current_rss() + self.worker_base_bytes * self.workers + self.in_flight
+
+    def try_acquire(self, estimate, running):
+        # Always let one page through so that a single oversized page cannot stall the run
+        if running and self.committed() + estimate > self.budget_bytes:
+            return False
+        if not running and self.committed() + estimate > self.budget_bytes:
+            logger.warning(f"Page needs an estimated {estimate / 2**20:.0f} MB, over the memory budget; "
+                           f"converting it alone")
+        self.in_flight += estimate
+        self.peak_estimate = max(self.peak_estimate, self.committed())
+        return True
+
+    def release(self, estimate, report):
+        self.in_flight -= estimate
+        self.worker_base_bytes = max(self.worker_base_bytes, report['base_bytes'])
+        page_bytes = max(0, report['peak_bytes'] - report['base_bytes'])
+        self.bytes_per_source_byte = max(self.bytes_per_source_byte, page_bytes / max(1, report['source_bytes']))
+
+
+def map_within_budget(executor, fn, tasks, budget):
+    """
+    Runs fn(*args) on the executor for every (args, source_bytes) task, starting a
+    task only when the budget admits it, and yields results as they complete.
+    fn must return a dict with source_bytes, base_bytes and peak_bytes.
+    """
+    pending = list(reversed(tasks))
+    running = {}
+    try:
+        while pending or running:
+            while pending:
+                args, source_bytes = pending[-1]
+                estimate = budget.estimate(source_bytes)
+                if len(running) >= budget.workers or not budget.try_acquire(estimate, len(running)):
+                    break
+                pending.pop()
+                running[executor.submit(fn, *args)] = estimate
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                estimate = running.pop(future)
+                report = future.result()
+                budget.release(estimate, report)
+                yield report
+    finally:
+        for future in running:
+            future.cancel()
@@ -0,0 +1,116 @@
+import json
+import time
+import threading
+
+from utils import write_atomic
+
+PROMETHEUS_PREFIX = 'gitbook_ft'
+
+# name -> (prometheus type, help text)
+METRICS = {
+    'run_success': ('gauge', '1 if the last run completed successfully, 0 otherwise'),
+    'run_timestamp_seconds': ('gauge', 'Unix time at which the last run finished'),
+    'run_duration_seconds': ('gauge', 'Wall time of the last run'),
+    'pages_total': ('gauge', 'Markdown pages found'),
+    'pages_converted': ('gauge', 'Pages converted in the last run'),
+    'pages_skipped': ('gauge', 'Pages not converted because the run stopped early'),
+    'pages_failed': ('gauge', 'Pages whose conversion raised an error'),
+    'pages_resumed': ('gauge', 'Pages converted by an interrupted run and taken from its journal'),
+    'bytes_in': ('gauge', 'Markdown bytes read'),
+    'bytes_out': ('gauge', 'HTML bytes written'),
+    'links_checked': ('gauge', 'Internal links validated'),
+    'broken_links': ('gauge', 'Internal links that do not resolve'),
+    'stage_duration_seconds': ('gauge', 'Wall time of each pipeline stage'),
+    'pages_by_path': ('gauge', 'Pages per conversion path: fast, full, or the optional passes they ran'),
+    'archive_parts': ('gauge', 'Number of ZIP archives the output was split into'),
+    'archive_bytes': ('gauge', 'Total size of the ZIP archives'),
+    'archive_uncompressed_bytes': ('gauge', 'Total size of the files in the ZIP archives'),
+    'excluded_files': ('gauge', 'Files left out of the archives because the TOC does not reach them'),
+    'excluded_bytes': ('gauge', 'Size of the files left out of the archives'),
+    'compression_ratio': ('gauge', 'Uncompressed size divided by archive size'),
+    'upload_bytes': ('gauge', 'Bytes uploaded to Fluid Topics'),
+    'upload_seconds': ('gauge', 'Time spent uploading to Fluid Topics'),
+    'upload_bytes_per_second': ('gauge', 'Upload throughput'),
+    'retries': ('gauge', 'Upload retries'),
+    'cache_hits': ('gauge', 'Conversion cache hits'),
+    'cache_misses': ('gauge', 'Conversion cache misses'),
+    'cache_hit_ratio': ('gauge', 'Conversion cache hits divided by lookups'),
+}
+
+# Label of the metrics whose value is a dict, one sample per key
+LABELS = {'stage_duration_seconds': 'stage', 'pages_by_path': 'path'}
+
+
+class RunMetrics:
+    """
+    Collects the numbers of one run and writes them, when the run ends, as JSON and
+    as a Prometheus textfile (for node_exporter's textfile collector).
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.stage_seconds = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def get(self, name, default=0):
+        with self.lock:
+            return self.values.get(name, default)
+
+    def set_stage_seconds(self, stage, seconds):
+        with self.lock:
+            self.stage_seconds[stage] = seconds
+
+    def finish(self, success):
+        self.set('run_success', 1 if success else 0)
+        self.set('run_timestamp_seconds', round(time.time(), 3))
+        self.set('run_duration_seconds', round(time.time() - self.started, 3))
+
+        archive_bytes = self.get('archive_bytes')
+        if archive_bytes:
+            self.set('compression_ratio', round(self.get('archive_uncompressed_bytes') / archive_bytes, 3))
+        if self.get('upload_seconds'):
+            self.set('upload_bytes_per_second', round(self.get('upload_bytes') / self.get('upload_seconds'), 1))
+        lookups = self.get('cache_hits') + self.get('cache_misses')
+        if lookups:
+            self.set('cache_hit_ratio', round(self.get('cache_hits') / lookups, 4))
+
+    def to_dict(self):
+        with self.lock:
+            data = {name: self.values[name] for name in METRICS if name in self.values}
+            data['stage_duration_seconds'] = {stage: round(seconds, 3)
+                                              for stage, seconds in self.stage_seconds.items()}
+        return data
+
+    def to_prometheus(self):
+        lines = []
+        for name, value in self.to_dict().items():
+            metric_type, help_text = METRICS[name]
+            full_name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            if isinstance(value, dict):
+                for label, labelled_value in sorted(value.items()):
+                    lines.append(f'{full_name}{{{LABELS[name]}="{label}"}} {labelled_value}')
+            else:
+                lines.append(f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, base_path):
+        """
+        Writes <base_path>.json and <base_path>.prom. Each file is replaced atomically
+        so that a scraper never reads a half-written file.
+        """
+        json_path = f"{base_path}.json"
+        prometheus_path = f"{base_path}.prom"
+        write_atomic(json_path, json.dumps(self.to_dict(), indent=2) + "\n")
+        write_atomic(prometheus_path, self.to_prometheus())
+        return json_path, prometheus_path
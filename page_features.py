@@ -0,0 +1,63 @@
+import re
+
+# Constructs that need a pass of their own in HTMLConverter
+TABLES = 'tables'
+CODE = 'code'
+BLOCKS = 'blocks'
+ENTITIES = 'entities'
+ALL_FEATURES = frozenset((TABLES, CODE, BLOCKS, ENTITIES))
+
+# One alternation over the raw bytes finds every construct in a single scan; the
+# lookahead lets the engine skip bytes that cannot start one. Raw HTML only counts
+# for the elements the passes rewrite. An include pulls in content the scan cannot
+# see, so it sends the page down the full path.
+FEATURE_PATTERN = re.compile(rb'''
+    (?=[{<|`~\n&])
+    (?:
+          (?P<include>\{%[ \t]*include\b)
+        | (?P<blocks>\{%|<div\b)
+        | (?P<tables>\||<table\b)
+        | (?P<code>`|~~~|<pre\b|<code\b|\n(?:\ {4}|\t))
+        | (?P<entities>&)
+    )
+''', re.VERBOSE | re.IGNORECASE)
+INDENTED_CODE = (b'    ', b'\t')
+
+
+def scan_features(data):
+    """
+    Returns the features the Markdown bytes contain, stopping as soon as all are found.
+    """
+    # An indented code block on the first line has no newline before it
+    found = {CODE} if data.startswith(INDENTED_CODE) else set()
+    for match in FEATURE_PATTERN.finditer(data):
+        feature = match.lastgroup
+        if feature == 'include':
+            return ALL_FEATURES
+        if feature not in found:
+            found.add(feature)
+            if len(found) == len(ALL_FEATURES):
+                break
+    return frozenset(found)
+
+
+def scan_file(path):
+    with open(path, 'rb') as file:
+        return scan_features(file.read())
+
+
+def scan_pages(paths):
+    """
+    Bulk pre-scan of the pages to convert, before any is parsed: returns path -> features.
+    """
+    return {path: scan_file(path) for path in paths}
+
+
+def conversion_path(features):
+    """
+    Names the path a page takes, for reporting: 'fast' for plain prose, 'full' for
+    every pass, otherwise the optional passes it runs.
+    """
+    if features is None or features == ALL_FEATURES:
+        return 'full'
+    return '+'.join(sorted(features)) or 'fast'
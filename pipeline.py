@@ -0,0 +1,197 @@
+import queue
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class Channel:
+    """
+    Bounded queue between a producing and a consuming stage. Iterating over a channel
+    yields items until the producer closes it; put blocks while the channel is full.
+    """
+    _CLOSED = object()
+
+    def __init__(self, name, producer, consumer, maxsize, abort_event):
+        self.name = name
+        self.producer = producer
+        self.consumer = consumer
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._abort = abort_event
+
+    def put(self, item):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted(f"Pipeline aborted while {self.producer} was writing to {self.name}")
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        self.put(self._CLOSED)
+
+    def __iter__(self):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted(f"Pipeline aborted while {self.consumer} was reading from {self.name}")
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is self._CLOSED:
+                return
+            yield item
+
+
+class Stage:
+    def __init__(self, name, func, deps):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = {}
+        self.outputs = {}
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class PipelineScheduler:
+    """
+    Runs pipeline stages as a dependency graph, each stage in its own thread.
+
+    A stage starts once all of its `deps` have finished and receives their results.
+    Stages connected by a channel run concurrently: the producer streams items to the
+    consumer through a bounded queue, so the consumer can finish shortly after the
+    producer instead of waiting for it to start.
+
+    Stage functions are called as func(stage, results), where results maps each
+    dependency name to its return value and stage.inputs / stage.outputs hold the
+    channels by name. A producer must close its output channels when it is done.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._abort = threading.Event()
+        self._origin = None
+
+    def add_stage(self, name, func, deps=()):
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, func, deps)
+        return self.stages[name]
+
+    def add_channel(self, name, producer, consumer, maxsize=64):
+        channel = Channel(name, producer, consumer, maxsize, self._abort)
+        self.stages[producer].outputs[name] = channel
+        self.stages[consumer].inputs[name] = channel
+        return channel
+
+    def _run_stage(self, stage):
+        try:
+            for dep in stage.deps:
+                self.stages[dep].done.wait()
+                if self.stages[dep].error is not None:
+                    raise PipelineAborted(f"{stage.name} skipped: {dep} failed")
+            stage.started = time.perf_counter()
+            results = {dep: self.stages[dep].result for dep in stage.deps}
+            stage.result = stage.func(stage, results)
+        except BaseException as e:
+            stage.error = e
+            self._abort.set()
+        finally:
+            stage.finished = time.perf_counter()
+            if stage.started is None:
+                stage.started = stage.finished
+            stage.done.set()
+
+    def run(self):
+        """
+        Runs every stage and returns a dict of stage name -> result. The first stage
+        failure aborts the other stages and is re-raised.
+        """
+        self._origin = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(stage,), name=f"stage-{stage.name}", daemon=True)
+            for stage in self.stages.values()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        errors = [stage.error for stage in self.stages.values()
+                  if stage.error is not None and not isinstance(stage.error, PipelineAborted)]
+        if errors:
+            raise errors[0]
+        aborted = [stage.error for stage in self.stages.values() if stage.error is not None]
+        if aborted:
+            raise aborted[0]
+        return {name: stage.result for name, stage in self.stages.items()}
+
+    def _predecessors(self, stage):
+        producers = [channel.producer for channel in stage.inputs.values()]
+        return [self.stages[name] for name in stage.deps + producers]
+
+    def critical_path(self):
+        """
+        Returns the chain of stages that determined end-to-end latency, from first to
+        last: starting at the stage that finished last, repeatedly step to the
+        dependency or producer that finished last.
+        """
+        finished = [stage for stage in self.stages.values() if stage.finished is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda stage: stage.finished)]
+        while True:
+            predecessors = [stage for stage in self._predecessors(path[-1]) if stage.finished is not None]
+            if not predecessors:
+                break
+            path.append(max(predecessors, key=lambda stage: stage.finished))
+        return list(reversed(path))
+
+    def report(self):
+        """
+        Returns per-stage timings (seconds since the pipeline started) and the
+        critical path.
+        """
+        stages = {}
+        for stage in self.stages.values():
+            if stage.started is None:
+                continue
+            stages[stage.name] = {
+                'start': round(stage.started - self._origin, 3),
+                'end': round(stage.finished - self._origin, 3),
+                'duration': round(stage.duration, 3),
+                'failed': stage.error is not None,
+            }
+        critical_path = [stage.name for stage in self.critical_path()]
+        total = max((timing['end'] for timing in stages.values()), default=0)
+        return {'total': total, 'stages': stages, 'critical_path': critical_path}
+
+    def log_report(self):
+        report = self.report()
+        logger.info(f"Pipeline finished in {report['total']:.2f}s")
+        for name, timing in sorted(report['stages'].items(), key=lambda item: item[1]['start']):
+            marker = '*' if name in report['critical_path'] else ' '
+            logger.info(f" {marker} {name:<10} {timing['start']:>8.2f}s -> {timing['end']:>8.2f}s "
+                        f"({timing['duration']:.2f}s)")
+        logger.info(f"Critical path: {' -> '.join(report['critical_path'])}")
+        return report
@@ -0,0 +1,266 @@
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+TOP_ALLOCATIONS = 25
+# Keeps the profiler's own bookkeeping out of the allocation reports
+TRACEMALLOC_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+# From Python 3.12, cProfile runs on sys.monitoring, which allows a single active
+# profiler per process: stages that run at the same time take turns
+_cprofile_lock = threading.Lock()
+
+
+def start_cprofile(name, profile=None):
+    """
+    Enables profile (a new cProfile.Profile by default) and returns it, or returns
+    None when another stage, or another profiling tool, holds the profiler.
+    """
+    if not _cprofile_lock.acquire(blocking=False):
+        logger.warning(f"Another stage holds cProfile; {name} only gets sampled stacks and allocations")
+        return None
+    profile = profile or cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        _cprofile_lock.release()
+        logger.warning(f"Not running cProfile for {name}: {e}")
+        return None
+    return profile
+
+
+def stop_cprofile(profile):
+    if profile is not None:
+        profile.disable()
+        _cprofile_lock.release()
+
+
+def safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+
+class StackSampler:
+    """
+    Samples the Python stack of one thread at a fixed interval and counts identical
+    stacks, which is exactly the "folded" format read by flamegraph.pl, speedscope
+    and inferno.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        # Code object of the outermost frame to keep, e.g. to drop the frames a forked
+        # worker inherited from its parent
+        self.root = root
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = None if code is self.root else frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class Profiler:
+    """
+    Opt-in per-stage profiling. For every profiled stage it writes to output_dir:
+
+        <stage>.prof        cProfile stats (open with pstats or snakeviz)
+        <stage>.alloc.txt   top allocating source lines while the stage ran
+        <stage>.folded      sampled stacks in folded format, for flame graphs
+
+    cProfile and the sampler only see the thread that runs the stage. Stages that
+    fan out to worker processes profile each task with profile_task, and merge_parts
+    folds the per-task results into the stage's files. cProfile profiles one stage at
+    a time: a stage that starts while another holds it gets no .prof file. tracemalloc
+    is process-wide, so the allocations of stages that run at the same time show up in
+    each other's report.
+    """
+
+    def __init__(self, output_dir, enabled=True):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self._tracemalloc_users = 0
+        self._lock = threading.Lock()
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def _start_tracemalloc(self):
+        with self._lock:
+            if self._tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+            self._tracemalloc_users += 1
+
+    def _stop_tracemalloc(self):
+        with self._lock:
+            self._tracemalloc_users -= 1
+            if self._tracemalloc_users == 0:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        self._start_tracemalloc()
+        before = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        start = time.perf_counter()
+        profile = start_cprofile(name)
+        try:
+            yield
+        finally:
+            stop_cprofile(profile)
+            sampler.stop()
+            after = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+            self._stop_tracemalloc()
+            self._write(name, profile, after.compare_to(before, 'lineno'), sampler.stacks)
+            logger.info(f"Profiled {name} ({time.perf_counter() - start:.2f}s) into {self.output_dir}")
+
+    def wrap(self, name, func):
+        def profiled(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return profiled
+
+    def _paths(self, name, folder=None):
+        base = os.path.join(folder or self.output_dir, safe_name(name))
+        return f"{base}.prof", f"{base}.alloc.txt", f"{base}.folded"
+
+    def _write(self, name, profile, allocation_diff, stacks, folder=None):
+        prof_path, alloc_path, folded_path = self._paths(name, folder)
+        if profile is not None:
+            profile.dump_stats(prof_path)
+        with open(alloc_path, 'w', encoding='utf-8') as file:
+            for stat in allocation_diff[:TOP_ALLOCATIONS]:
+                frame = stat.traceback[0]
+                file.write(f"{stat.size_diff:>12} B {stat.count_diff:>+9} blocks  {frame.filename}:{frame.lineno}\n")
+        write_folded(folded_path, stacks)
+
+    def parts_dir(self, name):
+        return os.path.join(self.output_dir, 'parts', safe_name(name))
+
+    def merge_parts(self, name):
+        """
+        Merges the per-task files written by profile_task into the stage's files, and
+        removes them.
+        """
+        parts_dir = self.parts_dir(name)
+        folded_parts = glob.glob(os.path.join(parts_dir, '*.folded'))
+        if not folded_parts:
+            return
+        prof_path, alloc_path, folded_path = self._paths(name)
+
+        prof_parts = sorted(glob.glob(os.path.join(parts_dir, '*.prof')))
+        if prof_parts:
+            pstats.Stats(*prof_parts).dump_stats(prof_path)
+
+        stacks = Counter()
+        for part in folded_parts:
+            stacks.update(read_folded(part))
+        write_folded(folded_path, stacks)
+
+        allocations = Counter()
+        for part in glob.glob(os.path.join(parts_dir, '*.alloc.txt')):
+            with open(part, 'r', encoding='utf-8') as file:
+                for line in file:
+                    size, _, location = line.split(None, 2)
+                    allocations[location.strip()] += int(size)
+        with open(alloc_path, 'w', encoding='utf-8') as file:
+            for location, size in allocations.most_common(TOP_ALLOCATIONS):
+                file.write(f"{size:>12} B  {location}\n")
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(parts_dir))
+        except OSError:
+            pass
+        logger.info(f"Merged the profiles of {len(folded_parts)} workers of {name} into {self.output_dir}")
+
+
+# Per worker process: (output_dir, stage_name) -> accumulated profile of its tasks
+_task_profiles = {}
+
+
+def profile_task(output_dir, stage_name, func, *args):
+    """
+    Runs func(*args) in a worker process under the profiler. Every task a worker runs
+    for a stage accumulates into one set of files per worker process under the stage's
+    parts folder, which Profiler.merge_parts combines when the stage is done. Workers
+    must not be forked from a process that is running cProfile (see start_cprofile).
+    """
+    key = (output_dir, stage_name)
+    if key not in _task_profiles:
+        parts_dir = Profiler(output_dir).parts_dir(stage_name)
+        os.makedirs(parts_dir, exist_ok=True)
+        _task_profiles[key] = (parts_dir, cProfile.Profile(), Counter(), Counter())
+    parts_dir, profile, stacks, allocations = _task_profiles[key]
+
+    tracemalloc.start(10)
+    before = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+    sampler = StackSampler(threading.get_ident(), root=profile_task.__code__)
+    sampler.start()
+    profiled = start_cprofile(stage_name, profile)
+    try:
+        return func(*args)
+    finally:
+        stop_cprofile(profiled)
+        sampler.stop()
+        after = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_FILTERS)
+        tracemalloc.stop()
+        stacks.update(sampler.stacks)
+        for stat in after.compare_to(before, 'lineno'):
+            frame = stat.traceback[0]
+            allocations[f"{frame.filename}:{frame.lineno}"] += stat.size_diff
+
+        # Rewritten after every task: pool workers get no shutdown hook
+        base = os.path.join(parts_dir, str(os.getpid()))
+        if profiled is not None:
+            profile.dump_stats(f"{base}.prof")
+        write_folded(f"{base}.folded", stacks)
+        with open(f"{base}.alloc.txt", 'w', encoding='utf-8') as file:
+            for location, size in allocations.most_common():
+                file.write(f"{size:>12} B  {location}\n")
+
+
+def write_folded(path, stacks):
+    with open(path, 'w', encoding='utf-8') as file:
+        for stack, count in stacks.most_common():
+            file.write(f"{stack} {count}\n")
+
+
+def read_folded(path):
+    stacks = Counter()
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
@@ -0,0 +1,220 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, urlsplit
+
+import yaml
+
+# Links a page can hold: Markdown [text](url) and ![alt](url), optionally as <url>,
+# and HTML href/src attributes
+MARKDOWN_LINK_PATTERN = re.compile(r'\]\(\s*(?:<([^>\n]+)>|([^)\s]+))')
+HTML_LINK_PATTERN = re.compile(r'''(?:href|src)\s*=\s*["']([^"']+)["']''')
+PAGE_EXTENSIONS = ('.md', '.html', '.htm')
+
+
+def link_paths(text, extension):
+    urls = HTML_LINK_PATTERN.findall(text)
+    if extension == '.md':
+        urls.extend(bracketed or bare for bracketed, bare in MARKDOWN_LINK_PATTERN.findall(text))
+    paths = []
+    for url in urls:
+        parts = urlsplit(url.strip())
+        if not parts.scheme and not parts.netloc and parts.path:
+            paths.append(unquote(parts.path))
+    return paths
+
+
+def link_target(name, path):
+    """
+    Returns the archive name path points to from the file name, before any file is
+    looked up. A path that leaves the folder comes back as '..' or starting with '../'.
+    """
+    if path.startswith('/'):
+        target = os.path.normpath(path.lstrip('/'))
+    else:
+        target = os.path.normpath(os.path.join(os.path.dirname(name), path))
+    return target.replace(os.sep, '/')
+
+
+def leaves_folder(target):
+    return target == '..' or target.startswith('../')
+
+
+def resolve(files, name, path):
+    """
+    Returns the archive name path points to from the file name, or None if it is not
+    one of files. Links to a folder point to its README, and links to a .md page that
+    was converted point to the converted page.
+
+    The link checker resolves links with this function too, so that pruning keeps
+    every page a valid link leads to.
+    """
+    target = link_target(name, path)
+    if leaves_folder(target):
+        return None
+    if target in files:
+        return target
+    stem, extension = os.path.splitext(target)
+    if extension == '.md':
+        for candidate in (stem + '.html', stem + '.htm'):
+            if candidate in files:
+                return candidate
+    # md2ft renames README.md to _README.md
+    for readme in ('README.md', '_README.md', 'README.html'):
+        candidate = readme if target == '.' else f"{target}/{readme}"
+        if candidate in files:
+            return candidate
+    return None
+
+
+def toc_pages(toc_path):
+    """
+    Returns the pages a TOC names, relative to its folder: the href of each node of an
+    FTMAP, the filepath of each entry of a toc.yml, or the links of a SUMMARY.md.
+    """
+    extension = os.path.splitext(toc_path)[1].lower()
+    if extension == '.ftmap':
+        root = ET.parse(toc_path).getroot()
+        return [node.get('href').split('#', 1)[0] for node in root.iter() if node.get('href')]
+    with open(toc_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+    if extension in ('.yml', '.yaml'):
+        def filepaths(entries):
+            for entry in entries:
+                if entry.get('filepath'):
+                    yield entry['filepath']
+                yield from filepaths(entry.get('children', []))
+        return list(filepaths((yaml.safe_load(text) or {}).get('toc', [])))
+    return link_paths(text, '.md')
+
+
+def archive_files(folders, exclude=()):
+    """
+    Maps the archive name of every file under folders, a list of (prefix, folder), to
+    its path on disk. Files in exclude are left out.
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    files = {}
+    for prefix, folder in folders:
+        for root, _, names in os.walk(folder):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.abspath(path) not in excluded:
+                    files[os.path.join(prefix, os.path.relpath(path, folder)).replace(os.sep, '/')] = path
+    return files
+
+
+class Reachability:
+    """
+    Follows links from the TOC to find the files a publication uses: the TOC itself,
+    the pages it names, the pages and images those pages link to, and so on.
+
+    Links can be added as they become known (add_links), so a packager can write each
+    file the moment it is both reachable and ready; walk() reads the rest from disk.
+    """
+
+    def __init__(self, files, roots):
+        self.files = files
+        self.reached = set()
+        self.links = {}
+        self.reach(roots)
+
+    def reach(self, names):
+        """
+        Marks names and everything their known links lead to as reachable, and returns
+        the names that were not reachable before.
+        """
+        new = []
+        stack = [name for name in names if name in self.files]
+        while stack:
+            name = stack.pop()
+            if name in self.reached:
+                continue
+            self.reached.add(name)
+            new.append(name)
+            stack.extend(self.links.get(name, ()))
+        return new
+
+    def add_links(self, name, targets):
+        """
+        Records the files name links to. Returns the names this makes reachable.
+        """
+        self.links[name] = [target for target in targets if target in self.files]
+        return self.reach(self.links[name]) if name in self.reached else []
+
+    def page_links(self, name):
+        extension = os.path.splitext(name)[1].lower()
+        with open(self.files[name], 'r', encoding='utf-8', errors='replace') as file:
+            text = file.read()
+        targets = (resolve(self.files, name, path) for path in link_paths(text, extension))
+        return [target for target in targets if target]
+
+    def walk(self):
+        """
+        Reads the links of every reachable page not added with add_links, until
+        nothing new is reached, and returns the reachable names.
+        """
+        stack = list(self.reached)
+        while stack:
+            name = stack.pop()
+            if name in self.links or not name.lower().endswith(PAGE_EXTENSIONS):
+                continue
+            stack.extend(self.add_links(name, self.page_links(name)))
+        return self.reached
+
+    def excluded(self):
+        return sorted(name for name in self.files if name not in self.reached)
+
+
+def reachable_files(folders, toc_name, exclude=(), keep=()):
+    """
+    Returns the (archive name, path) pairs reachable from the TOC at archive name
+    toc_name, and the (archive name, size) pairs of the files left out. keep names
+    files that are packaged even when nothing links to them.
+    """
+    files = archive_files(folders, exclude)
+    roots = [toc_name, *keep]
+    roots.extend(resolve(files, toc_name, page) for page in toc_pages(files[toc_name]))
+    reachability = Reachability(files, [root for root in roots if root])
+    reachability.walk()
+    kept = [(name, files[name]) for name in sorted(reachability.reached)]
+    excluded = [(name, os.path.getsize(files[name])) for name in reachability.excluded()]
+    return kept, excluded
+
+
+def package_reachable(folders, toc_name, zip_path, exclude=(), keep=()):
+    """
+    Writes the files reachable from the TOC to zip_path and returns the (archive name,
+    size) pairs of the files left out.
+    """
+    kept, excluded = reachable_files(folders, toc_name, exclude=[*exclude, zip_path], keep=keep)
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, path in kept:
+            archive.write(path, name)
+    return excluded
+
+
+def summarize_excluded(excluded):
+    """
+    Groups excluded (name, size) pairs by top-level folder, e.g. .git, for reporting.
+    Returns (group, files, bytes) tuples, largest first.
+    """
+    groups = {}
+    for name, size in excluded:
+        group = name.split('/', 1)[0] + '/' if '/' in name else name
+        files, total = groups.get(group, (0, 0))
+        groups[group] = (files + 1, total + size)
+    return sorted(((group, files, total) for group, (files, total) in groups.items()),
+                  key=lambda item: item[2], reverse=True)
+
+
+def excluded_report(excluded):
+    """
+    Returns the lines describing what pruning left out and how many bytes it saved.
+    """
+    total = sum(size for _, size in excluded)
+    lines = [f"Excluded {len(excluded)} unreachable files ({total / 2**20:.2f} MB)"]
+    for group, files, size in summarize_excluded(excluded):
+        lines.append(f"  {group}: {files} files, {size / 2**20:.2f} MB")
+    return lines
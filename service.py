@@ -0,0 +1,332 @@
+import io
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import logging
+import tarfile
+import argparse
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from backends import HTMLConverterBackend, run_backend
+from fluid_topics_client import FluidTopicsClient
+from utils import load_config
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+RESULT_TYPES = ('archive', 'ftmap')
+# Latencies kept for the percentiles of /metrics
+LATENCY_WINDOW = 1000
+# Largest request body accepted, i.e. the largest repository tarball
+MAX_BODY_MB = 256
+
+
+def warm_up():
+    # The pool initializer: runs in every worker process before its first task, so
+    # that no job pays for imports
+    import html_converter
+    html_converter.HTMLConverter(None).render_markdown('# warm up')
+
+
+class Job:
+    def __init__(self, title, result_type, upload, repo_path=None, tarball=None):
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.result_type = result_type
+        self.upload = upload
+        self.repo_path = repo_path
+        self.tarball = tarball
+        self.status = 'queued'
+        self.error = None
+        self.pages = None
+        self.result_path = None
+        self.uploaded = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'title': self.title,
+            'result': self.result_type,
+            'pages': self.pages,
+            'uploaded': self.uploaded,
+            'error': self.error,
+            'queue_seconds': round(self.started - self.submitted, 3) if self.started else None,
+            'run_seconds': round(self.finished - self.started, 3) if self.finished and self.started else None,
+        }
+
+
+class ConversionService:
+    """
+    Runs conversion jobs from a queue on a pool of pre-warmed worker processes.
+
+    Each job is converted with the HTML backend into its own work folder; finished
+    jobs keep their result until `max_finished_jobs` newer jobs have completed.
+
+    Jobs that name a repository folder may only read folders under `repo_root`; with
+    no `repo_root`, only tarballs are accepted.
+    """
+
+    def __init__(self, workers=None, concurrent_jobs=1, max_finished_jobs=100, work_root=None, repo_root=None):
+        workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+        # Start the worker processes now rather than with the first job
+        for future in [self.executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        self.backend = HTMLConverterBackend()
+        self.work_root = work_root or tempfile.mkdtemp(prefix='ft_service_')
+        self.repo_root = os.path.realpath(repo_root) if repo_root else None
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.finished_ids = deque()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.running = 0
+        self.dispatchers = [
+            threading.Thread(target=self._dispatch, name=f"job-dispatcher-{i}", daemon=True)
+            for i in range(concurrent_jobs)
+        ]
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def repo_folder(self, repo_path):
+        """
+        Returns the real path of repo_path, relative to repo_root unless absolute.
+        Raises PermissionError if it is not under repo_root.
+        """
+        if self.repo_root is None:
+            raise PermissionError("Repository folders are disabled; start the service with --repo-root "
+                                  "or send a tarball")
+        folder = os.path.realpath(os.path.join(self.repo_root, repo_path))
+        if os.path.commonpath([folder, self.repo_root]) != self.repo_root:
+            raise PermissionError(f"repo_path must be inside {self.repo_root}")
+        return folder
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            statuses = [job.status for job in self.jobs.values()]
+            running = self.running
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3)
+
+        return {
+            'queue_depth': self.queue.qsize(),
+            'running': running,
+            'completed': statuses.count('done'),
+            'failed': statuses.count('failed'),
+            'latency_seconds': {
+                'count': len(latencies),
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1], 3) if latencies else None,
+            },
+        }
+
+    def _materialize(self, job, work_dir):
+        source_folder = os.path.join(work_dir, 'source')
+        if job.tarball is not None:
+            with tarfile.open(fileobj=io.BytesIO(job.tarball)) as archive:
+                # The data filter rejects absolute paths, links out of the tree and device files
+                archive.extractall(source_folder, filter='data')
+            job.tarball = None
+            entries = os.listdir(source_folder)
+            # Tarballs made with "tar czf docs.tgz docs/" wrap everything in one folder
+            if len(entries) == 1 and os.path.isdir(os.path.join(source_folder, entries[0])):
+                source_folder = os.path.join(source_folder, entries[0])
+        else:
+            if not os.path.isdir(job.repo_path):
+                raise FileNotFoundError(f"Repository folder not found: {job.repo_path}")
+            source_folder = job.repo_path
+        if not os.path.exists(os.path.join(source_folder, 'SUMMARY.md')):
+            raise FileNotFoundError("SUMMARY.md not found in the job's repository")
+        return source_folder
+
+    def _run(self, job):
+        work_dir = os.path.join(self.work_root, job.id)
+        os.makedirs(work_dir)
+        source_folder = self._materialize(job, work_dir)
+        result = run_backend(self.backend, source_folder, os.path.join(work_dir, 'output'), job.title,
+                             archive_path=os.path.join(work_dir, 'archive.zip'), executor=self.executor)
+        job.pages = result['pages']
+        job.result_path = result['archive'] if job.result_type == 'archive' else result['toc']
+        if job.upload:
+            job.uploaded = FluidTopicsClient(load_config()['fluid_topics']).upload(result['archive'])
+            if not job.uploaded:
+                raise RuntimeError("Failed to upload to Fluid Topics")
+
+    def _dispatch(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                self.running += 1
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                self._run(job)
+                job.status = 'done'
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                with self.lock:
+                    self.running -= 1
+                    self.latencies.append(job.finished - job.submitted)
+                    self.finished_ids.append(job.id)
+                    self._evict()
+            logger.info(f"Job {job.id} {job.status} in {job.finished - job.started:.2f}s")
+
+    def _evict(self):
+        while len(self.finished_ids) > self.max_finished_jobs:
+            job_id = self.finished_ids.popleft()
+            self.jobs.pop(job_id, None)
+            shutil.rmtree(os.path.join(self.work_root, job_id), ignore_errors=True)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        shutil.rmtree(self.work_root, ignore_errors=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+    max_body_bytes = MAX_BODY_MB * 2**20
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self, path, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, 'rb') as file:
+            shutil.copyfileobj(file, self.wfile)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/jobs':
+            return self._send_json(404, {'error': 'Not found'})
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > self.max_body_bytes:
+            # The body is left unread, so the connection cannot take another request
+            self.close_connection = True
+            if length < 0:
+                return self._send_json(400, {'error': 'Invalid Content-Length'})
+            return self._send_json(413, {'error': f'Request body exceeds {self.max_body_bytes} bytes'})
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                options = json.loads(body or b'{}')
+            except json.JSONDecodeError as e:
+                return self._send_json(400, {'error': f'Invalid JSON: {e}'})
+            repo_path, tarball = options.get('repo_path'), None
+        else:
+            # Any other body is a tarball of the repository; options go in the query string
+            options = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            repo_path, tarball = None, body
+
+        title = options.get('title')
+        result_type = options.get('result', 'archive')
+        upload = str(options.get('upload', 'false')).lower() in ('1', 'true', 'yes')
+        if not title:
+            return self._send_json(400, {'error': 'A publication title is required'})
+        if result_type not in RESULT_TYPES:
+            return self._send_json(400, {'error': f'result must be one of {RESULT_TYPES}'})
+        if not repo_path and not tarball:
+            return self._send_json(400, {'error': 'Send a repo_path or a tarball'})
+        if repo_path:
+            try:
+                repo_path = self.service.repo_folder(repo_path)
+            except PermissionError as e:
+                return self._send_json(403, {'error': str(e)})
+
+        job = self.service.submit(Job(title, result_type, upload, repo_path=repo_path, tarball=tarball))
+        self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['metrics']:
+            return self._send_json(200, self.service.metrics())
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': 'Unknown job'})
+            if len(parts) == 2:
+                return self._send_json(200, job.to_dict())
+            if parts[2] == 'result':
+                if job.status != 'done':
+                    return self._send_json(409, job.to_dict())
+                content_type = 'application/zip' if job.result_type == 'archive' else 'application/xml'
+                return self._send_file(job.result_path, content_type)
+        self._send_json(404, {'error': 'Not found'})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local conversion service with a warm worker pool.")
+    # The service has no authentication: keep it on localhost
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--concurrent-jobs', type=int, default=1, help="Jobs converted at the same time")
+    parser.add_argument('--max-body-mb', type=float, default=MAX_BODY_MB,
+                        help=f"Largest request body, i.e. repository tarball, accepted (default: {MAX_BODY_MB})")
+    parser.add_argument('--repo-root', help="Folder that jobs may name repositories in with repo_path "
+                                            "(default: none, tarballs only)")
+    args = parser.parse_args()
+
+    service = ConversionService(workers=args.workers, concurrent_jobs=args.concurrent_jobs,
+                                repo_root=args.repo_root)
+    ServiceHandler.service = service
+    ServiceHandler.max_body_bytes = int(args.max_body_mb * 2**20)
+    server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    logger.info(f"Conversion service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from archive_parts import FT_NAMESPACE, NODE, ORIGIN_ID, TITLE, ArchiveLimitError, ArchiveSplitter
+from link_checker import LinkIndex
+
+FTMAP = f'''<ft:map xmlns:ft="{FT_NAMESPACE}" ft:title="Docs" ft:originID="docs"><ft:toc>
+<ft:node ft:title="A" href="a/README.html"><ft:node ft:title="A1" href="a/one.html"/></ft:node>
+<ft:node ft:title="B" href="b/README.html"/>
+<ft:node ft:title="C" href="c/README.html"/>
+</ft:toc></ft:map>'''
+
+
+def make_site(tmp_path, links=None, sizes=None):
+    """
+    Writes the pages of FTMAP, each with an image, and indexes their links.
+    """
+    links = links or {}
+    sizes = sizes or {}
+    index = LinkIndex(str(tmp_path))
+    for page in ('a/README.html', 'a/one.html', 'b/README.html', 'c/README.html'):
+        image = page.replace('.html', '.png')
+        for path in (page, image):
+            (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / path).write_bytes(b'x' * sizes.get(path, 100))
+        urls = [os.path.basename(image)] + [os.path.relpath(target, os.path.dirname(page))
+                                            for target in links.get(page, ())]
+        index.add_page(str(tmp_path / page), {'anchors': [], 'links': urls})
+    return index, ET.fromstring(FTMAP)
+
+
+def part_pages(parts):
+    return [sorted(pages) for pages, _ in parts]
+
+
+def test_parts_stay_under_the_limit(tmp_path):
+    index, ftmap = make_site(tmp_path)
+    splitter = ArchiveSplitter(str(tmp_path), index, 450)
+
+    parts = splitter.plan(ftmap, [])
+
+    assert part_pages(parts) == [['a/README.html', 'a/one.html'], ['b/README.html', 'c/README.html']]
+    for _, files in parts:
+        assert sum(splitter.size(path) for path in files) <= 450
+    assert 'a/one.png' in parts[0][1] and 'c/README.png' in parts[1][1]
+
+
+def test_linked_branches_share_a_part(tmp_path):
+    index, ftmap = make_site(tmp_path, links={'a/one.html': ['c/README.html']})
+    splitter = ArchiveSplitter(str(tmp_path), index, 650)
+
+    parts = splitter.plan(ftmap, [])
+
+    assert part_pages(parts) == [['a/README.html', 'a/one.html', 'c/README.html'], ['b/README.html']]
+
+
+def test_linked_group_over_the_limit_stops_the_plan(tmp_path):
+    index, ftmap = make_site(tmp_path, links={'a/one.html': ['c/README.html']})
+
+    with pytest.raises(ArchiveLimitError, match='link to each other'):
+        ArchiveSplitter(str(tmp_path), index, 450).plan(ftmap, [])
+
+
+def test_part_ftmap_keeps_only_its_pages(tmp_path):
+    index, ftmap = make_site(tmp_path)
+    splitter = ArchiveSplitter(str(tmp_path), index, 450)
+
+    root = ET.fromstring(splitter.part_ftmap(ftmap, ['a/one.html'], 1, 2))
+
+    nodes = list(root.iter(NODE))
+    assert [node.get('href') for node in nodes] == [None, 'a/one.html']
+    assert root.get(TITLE) == 'Docs (1 of 2)'
+    assert root.get(ORIGIN_ID) == 'docs-part1'
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "md2ftml"))
+import assets
+
+
+@pytest.mark.parametrize("strategy", ["auto", "hardlink", "copy"])
+def test_staging_twice_keeps_source_bytes(tmp_path, strategy):
+    source = tmp_path / "src" / "assets"
+    source.mkdir(parents=True)
+    (source / "a.png").write_bytes(b"image bytes")
+
+    for _ in range(2):
+        assets.stage_tree(tmp_path / "src", tmp_path / "out", strategy)
+
+    assert (source / "a.png").read_bytes() == b"image bytes"
+    assert (tmp_path / "out" / "assets" / "a.png").read_bytes() == b"image bytes"
+
+
+def test_only_whole_references_are_rewritten(tmp_path):
+    folder = tmp_path / "assets"
+    folder.mkdir()
+    for name in ("a.png", "image (1).png", "image.png"):
+        (folder / name).write_bytes(b"image bytes")
+    page = tmp_path / "page.md"
+    page.write_text(
+        "![](assets/a.png) ![](../.gitbook/assets/a.png#zoom) ![](assets/banner-a.png)\n"
+        "[backup](assets/a.png.bak) ![](my-assets/a.png) ![](assets/a.png%20copy.png)\n"
+        '<img src="assets/image%20(1).png"> ![](assets/image (1).png)\n',
+        encoding="utf-8")
+
+    duplicates = {folder / "a.png": folder / "image.png", folder / "image (1).png": folder / "image.png"}
+
+    assert assets.rewrite_asset_references(tmp_path, folder, duplicates) == 1
+    assert page.read_text(encoding="utf-8") == (
+        "![](assets/image.png) ![](../.gitbook/assets/image.png#zoom) ![](assets/banner-a.png)\n"
+        "[backup](assets/a.png.bak) ![](my-assets/a.png) ![](assets/a.png%20copy.png)\n"
+        '<img src="assets/image.png"> ![](assets/image.png)\n')
@@ -0,0 +1,55 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import e2e_benchmark
+from e2e_benchmark import PAGES_PER_SECTION, UploadSink, benchmark_size, compare, generate_corpus
+
+
+def markdown_pages(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+                  for root, _, names in os.walk(folder) for name in names if name.endswith('.md'))
+
+
+def test_corpus_has_the_requested_pages_in_its_summary(tmp_path):
+    folder = generate_corpus(str(tmp_path / 'corpus'), PAGES_PER_SECTION + 2)
+
+    pages = markdown_pages(folder)
+    assert len(pages) == PAGES_PER_SECTION + 2 + 1  # and SUMMARY.md
+    with open(os.path.join(folder, 'SUMMARY.md'), 'r', encoding='utf-8') as file:
+        summary = file.read()
+    assert all(f"({page})" in summary for page in pages if page != 'SUMMARY.md')
+    assert 'section-1/README.md' in pages and 'section-1/page-1.md' not in pages
+
+
+def test_compare_flags_sizes_over_the_threshold():
+    results = {'100': {'seconds': 1.1}, '1000': {'seconds': 13.0}, '5000': {'seconds': 50.0}}
+    baseline = {'100': {'seconds': 1.0}, '1000': {'seconds': 10.0}}
+
+    assert compare(results, baseline, 0.2) == [('1000', pytest.approx(0.3))]
+    assert results['100']['slowdown'] == 0.1
+    assert 'slowdown' not in results['5000']
+
+
+@pytest.fixture
+def sink_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UploadSink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_benchmark_runs_the_full_flow(sink_url, monkeypatch, tmp_path):
+    monkeypatch.setattr(e2e_benchmark.tempfile, 'tempdir', str(tmp_path))
+
+    result = benchmark_size(20, sink_url)
+
+    assert result['pages'] == 20
+    assert result['archive_bytes'] > 0
+    assert result['uploaded_bytes'] >= result['archive_bytes']
+    assert {'convert', 'archive', 'upload'} <= set(result['stage_seconds'])
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fluid_topics_client
+from fluid_topics_client import FluidTopicsClient
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = b''
+
+
+def refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, '/upload', reason))
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    archive = tmp_path / 'docs.zip'
+    archive.write_bytes(b'zip')
+    monkeypatch.setattr(fluid_topics_client, 'RETRY_DELAY', 0)
+
+    def run(outcomes):
+        calls = []
+
+        def post(url, files, auth, timeout):
+            calls.append(timeout)
+            outcome = outcomes[len(calls) - 1]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return Response(outcome)
+
+        monkeypatch.setattr(fluid_topics_client.requests, 'post', post)
+        client = FluidTopicsClient({'api_key': 'k', 'base_url': 'http://ft', 'source_id': 's',
+                                    'upload_retries': 2, 'upload_timeout': 30})
+        return client.upload(str(archive)), calls
+
+    return run
+
+
+@pytest.mark.parametrize('outcomes', [[503, 200], [429, 200], [408, 200], [refused(), 200]])
+def test_retries_failures_before_the_archive_was_accepted(upload, outcomes):
+    uploaded, calls = upload(outcomes)
+    assert uploaded and len(calls) == 2
+
+
+@pytest.mark.parametrize('outcome', [400, 401, 413, requests.exceptions.ConnectionError("reset"),
+                                     requests.exceptions.ReadTimeout()])
+def test_does_not_retry_when_the_archive_may_have_been_accepted_or_is_rejected(upload, outcome):
+    uploaded, calls = upload([outcome, 200])
+    assert not uploaded and len(calls) == 1
+
+
+def test_requests_have_a_timeout(upload):
+    _, calls = upload([200])
+    assert calls == [(fluid_topics_client.CONNECT_TIMEOUT, 30)]
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gitbook_tags import nest_tags
+
+
+def tag(name, end=False, **attrs):
+    return {'type': 'gitbook_tag', 'name': name, 'end': end, 'attrs': attrs}
+
+
+def paragraph(text):
+    return {'type': 'paragraph', 'text': text}
+
+
+def test_closed_tags_nest_and_unclosed_tags_keep_their_content_beside_them():
+    tokens = [
+        tag('tabs'),
+        tag('tab', title='One'), paragraph('a'), tag('embed', url='u'), paragraph('b'), tag('tab', end=True),
+        tag('tab', title='Two'), paragraph('c'), tag('tab', end=True),
+        tag('tabs', end=True),
+        tag('hint', end=True),
+    ]
+
+    [tabs] = nest_tags(tokens)
+
+    assert tabs['attrs'] == {'name': 'tabs'}
+    first, second = tabs['children']
+    assert first['attrs'] == {'name': 'tab', 'title': 'One'}
+    assert first['children'] == [
+        paragraph('a'),
+        {'type': 'gitbook_block', 'attrs': {'name': 'embed', 'url': 'u'}, 'children': []},
+        paragraph('b'),
+    ]
+    assert second['children'] == [paragraph('c')]
+
+
+def test_many_unclosed_tags_take_linear_time():
+    count = 32000
+    tokens = [tag('hint')]
+    for index in range(count):
+        tokens.extend((tag('embed', url=str(index)), paragraph(str(index))))
+    tokens.append(tag('hint', end=True))
+
+    start = time.perf_counter()
+    [hint] = nest_tags(tokens)
+    elapsed = time.perf_counter() - start
+
+    assert len(hint['children']) == 2 * count
+    assert hint['children'][0]['attrs'] == {'name': 'embed', 'url': '0'}
+    assert hint['children'][-1] == paragraph(str(count - 1))
+    # Quadratic unwinding took several seconds here
+    assert elapsed < 1.0
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_converter import REPARSED_FEATURES, HTMLConverter
+from page_features import ALL_FEATURES, scan_file
+
+PAGES = {
+    'empty_paragraphs': '# Title\n\nIntro\n\n\\\n\nafter backslash\n\n<p></p>\n\nend\n',
+    'blank_blocks': '# T\n\n<p> </p>\n\n<div>\n\n</div>\n\nx\n',
+    'lists': '# T\n\n* a\n* b\n\n> quote\n\n<p>  </p>\n',
+    'hints': '# T\n\n{% hint style="info" %}\nnote\n{% endhint %}\n\ntext &amp; more\n\n'
+             '{% hint style="warning" %}\n\n{% endhint %}\n',
+    'inline_block': '# T\n\nbefore <div class="x">inside</div> after\n\n<p>\t</p>\n\nlast\n',
+}
+
+
+def convert(tmp_path, name, text, features, minify):
+    md_path = tmp_path / f'{name}.md'
+    md_path.write_text(text, encoding='utf-8')
+    html_path = tmp_path / f'{name}.html'
+    HTMLConverter(str(tmp_path), minify).convert_file(str(md_path), str(html_path), remove_source=False,
+                                                      features=features(str(md_path)))
+    return html_path.read_text(encoding='utf-8')
+
+
+@pytest.mark.parametrize('minify', [False, True])
+@pytest.mark.parametrize('name', sorted(PAGES))
+def test_fast_path_matches_reparsed_output(tmp_path, name, minify):
+    text = PAGES[name]
+
+    reparsed = convert(tmp_path, name, text, lambda path: ALL_FEATURES, minify)
+    fast = convert(tmp_path, name, text, scan_file, minify)
+
+    assert not scan_file(str(tmp_path / f'{name}.md')) & REPARSED_FEATURES
+    assert fast == reparsed
@@ -0,0 +1,42 @@
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_minifier import minify_soup, minify_style
+
+
+def minify(html):
+    return minify_soup(BeautifulSoup(html, 'html.parser'))
+
+
+def style_of(html):
+    return BeautifulSoup(minify(html), 'html.parser').find(True)['style']
+
+
+def test_data_uri_keeps_its_semicolon():
+    html = '<div style="background: url(data:image/png;base64,iVBORw0KGgo=) no-repeat ; color: red">x</div>'
+    assert style_of(html) == 'background:url(data:image/png;base64,iVBORw0KGgo=) no-repeat;color:red'
+
+
+def test_quoted_values_keep_semicolons_and_whitespace():
+    html = '''<p style='font-family: "My  Font; Bold", serif; content: ";"'>x</p>'''
+    assert style_of(html) == 'font-family:"My  Font; Bold", serif;content:";"'
+
+
+def test_custom_properties_keep_their_case():
+    style = minify_style('--Brand-Color: #F00; --brand-color: #0F0; COLOR: var(--Brand-Color)')
+    assert style == '--Brand-Color:#F00;--brand-color:#0F0;color:var(--Brand-Color)'
+
+
+def test_later_declaration_wins_unless_important():
+    assert minify_style('color: red !important; Color: blue; margin: 0') == 'color:red!important;margin:0'
+
+
+def test_pre_whitespace_round_trips():
+    html = '<div>\n  <pre><code>line 1\n    indented  &lt;tag&gt;\n\n</code></pre>\n  <p>a   b</p>\n</div>'
+    minified = minify(html)
+    assert minified == '<div><pre><code>line 1\n    indented  &lt;tag&gt;\n\n</code></pre><p>a b</p></div>'
+    original_pre = BeautifulSoup(html, 'html.parser').pre.get_text()
+    assert BeautifulSoup(minified, 'html.parser').pre.get_text() == original_pre
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_converter import HTMLConverter, include_cache
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+
+def test_nested_include_change_renders_fragment_again(tmp_path):
+    includes = tmp_path / '.gitbook' / 'includes'
+    write(includes / 'outer.md', 'Outer\n\n{% include "inner.md" %}\n')
+    write(includes / 'inner.md', 'inner v1\n')
+    page = str(tmp_path / 'README.md')
+
+    assert 'inner v1' in include_cache.fragment(str(includes / 'outer.md'), page)
+    write(includes / 'inner.md', 'inner v2\n')
+    fragment = include_cache.fragment(str(includes / 'outer.md'), page)
+
+    assert 'inner v2' in fragment and 'inner v1' not in fragment
+
+
+def test_snippets_are_not_pages(tmp_path):
+    write(tmp_path / 'README.md', '# A\n\n{% include "parts/shared.md" %}\n')
+    write(tmp_path / 'parts' / 'shared.md', 'Shared\n')
+    write(tmp_path / '.gitbook' / 'includes' / 'snippet.md', 'Snippet\n')
+
+    pages = HTMLConverter(str(tmp_path)).find_markdown_files()
+
+    assert pages == [str(tmp_path / 'README.md')]
@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_converter import HTMLConverter
+from journal import PARTIAL_SUFFIX, ConversionJournal, remove_partial_writes
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+
+def test_record_deletes_the_source_after_journaling(tmp_path):
+    write(tmp_path / 'docs' / 'page.md', '# Page\n')
+    write(tmp_path / 'docs' / 'page.html', '<p>Page</p>')
+    journal = ConversionJournal(str(tmp_path / 'docs.journal'), str(tmp_path / 'docs'))
+
+    journal.record(str(tmp_path / 'docs' / 'page.md'),
+                   {'html_path': str(tmp_path / 'docs' / 'page.html'), 'anchors': ['page'], 'links': []})
+    journal.close()
+
+    assert not (tmp_path / 'docs' / 'page.md').exists()
+    [line] = (tmp_path / 'docs.journal').read_text(encoding='utf-8').splitlines()
+    assert json.loads(line) == {'page': 'page.md', 'html_path': 'page.html', 'source_bytes': 7,
+                                'anchors': ['page'], 'links': []}
+
+
+def test_resume_after_a_partial_write(tmp_path):
+    folder = tmp_path / 'docs'
+    write(folder / 'done.md', '# Done\n\nConverted before the crash.\n')
+    write(folder / 'done.html', '<p>from the first run</p>')
+    write(folder / 'cut.md', '# Cut\n\nIts journal line was cut short.\n')
+    write(folder / 'todo.md', '# Todo\n\nNever reached.\n')
+    write(folder / f'.cut.html.x1y2{PARTIAL_SUFFIX}', '<p>half a pa')
+    # The first run journaled done.md but died before deleting its source, and died
+    # again while appending the line of cut.md
+    journal_path = tmp_path / 'docs.journal'
+    done = {'page': 'done.md', 'html_path': 'done.html', 'source_bytes': 34, 'anchors': ['done'], 'links': []}
+    journal_path.write_text(json.dumps(done) + '\n{"page": "cut.md", "html_pa', encoding='utf-8')
+
+    assert remove_partial_writes(str(folder)) == 1
+    journal = ConversionJournal(str(journal_path), str(folder))
+    assert list(journal.load()) == ['done.md']
+    assert journal.completed(str(folder / 'done.md')) == done
+    assert journal.completed(str(folder / 'cut.md')) is None
+
+    HTMLConverter(str(folder)).convert_all(journal)
+    journal.close()
+
+    assert sorted(os.listdir(folder)) == ['cut.html', 'done.html', 'todo.html']
+    assert (folder / 'done.html').read_text(encoding='utf-8') == '<p>from the first run</p>'
+    assert 'Its journal line was cut short.' in (folder / 'cut.html').read_text(encoding='utf-8')
+    resumed = ConversionJournal(str(journal_path), str(folder))
+    assert sorted(resumed.load()) == ['cut.md', 'done.md', 'todo.md']
+
+
+def test_remove_deletes_the_journal(tmp_path):
+    journal = ConversionJournal(str(tmp_path / 'docs.journal'), str(tmp_path))
+    (tmp_path / 'docs.journal').write_text('', encoding='utf-8')
+
+    journal.remove()
+
+    assert not journal.exists()
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+from link_checker import LinkIndex
+
+
+def make_index(tmp_path, pages):
+    """
+    Indexes pages, a mapping of page name to (anchors, links), and writes an image
+    for the links to point to.
+    """
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'logo.png').write_bytes(b'png')
+    index = LinkIndex(str(tmp_path))
+    for page, (anchors, links) in pages.items():
+        index.add_page(str(tmp_path / page), {'anchors': anchors, 'links': links})
+    return index
+
+
+def broken(index):
+    return [(link.page, link.url, link.reason) for link in index.validate()]
+
+
+def test_valid_links_resolve(tmp_path):
+    index = make_index(tmp_path, {
+        'README.html': (['welcome'], ['guide/setup.md#Install', 'guide', '#welcome', 'images/logo.png']),
+        'guide/README.html': ([], ['../README.md', 'setup.html#install']),
+        'guide/setup.html': (['install'], ['/images/logo.png']),
+    })
+
+    assert broken(index) == []
+    assert index.target('README.html', 'guide') == ('guide/README.html', '')
+    assert index.local_files('README.html') == {'images/logo.png'}
+
+
+def test_broken_pages_files_and_anchors_are_reported(tmp_path):
+    index = make_index(tmp_path, {
+        'README.html': (['welcome'], ['missing.md', '#nowhere', 'guide/setup.md#uninstall', 'images/none.png',
+                                      '../outside.md']),
+        'guide/setup.html': (['install'], []),
+    })
+
+    assert broken(index) == [
+        ('README.html', 'missing.md', 'missing.md does not exist'),
+        ('README.html', '#nowhere', 'no anchor #nowhere in README.html'),
+        ('README.html', 'guide/setup.md#uninstall', 'no anchor #uninstall in guide/setup.html'),
+        ('README.html', 'images/none.png', 'images/none.png does not exist'),
+        ('README.html', '../outside.md', 'points outside the publication'),
+    ]
+
+
+@pytest.mark.parametrize('mode, succeeds', [('fail', False), ('warn', True)])
+def test_broken_links_gate_the_upload(tmp_path, monkeypatch, mode, succeeds):
+    folder = tmp_path / 'docs'
+    folder.mkdir()
+    (folder / 'SUMMARY.md').write_text('# Summary\n\n* [Home](README.md)\n', encoding='utf-8')
+    (folder / 'README.md').write_text('# Home\n\nSee [the guide](guide.md).\n', encoding='utf-8')
+    uploads = []
+
+    class FluidTopicsClient:
+        uploaded_bytes = upload_seconds = retries = 0
+
+        def __init__(self, config):
+            pass
+
+        def upload(self, archive):
+            uploads.append(archive)
+            return True
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'FluidTopicsClient', FluidTopicsClient)
+    monkeypatch.setattr(sys, 'argv', ['main.py'])
+    for name, value in {'GITBOOK_REPO_FOLDER': str(folder), 'PUBLICATION_TITLE': 'Docs', 'BROKEN_LINKS': mode,
+                        'LINK_REPORT': str(tmp_path / 'links.json'),
+                        'METRICS_FILE': str(tmp_path / 'metrics')}.items():
+        monkeypatch.setenv(name, value)
+
+    if succeeds:
+        main.main()
+    else:
+        with pytest.raises(SystemExit):
+            main.main()
+
+    assert uploads == (['docs.zip'] if succeeds else [])
+    report = json.loads((tmp_path / 'links.json').read_text(encoding='utf-8'))
+    assert report['broken'] == [{'page': 'README.html', 'url': 'guide.md', 'reason': 'guide.md does not exist'}]
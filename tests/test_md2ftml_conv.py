@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "md2ftml"))
+import conv
+
+needs_pandoc = pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc is not installed")
+
+PAGES = {
+    "README.md": "# Home\n\nWelcome.\n\n{% include \".gitbook/includes/note.md\" %}\n",
+    "guide/setup.md": "# Setup\n\nRun `make`.\n\n* one\n* two\n",
+    "guide/usage.md": "# Usage\n\nSee [setup](setup.md).\n",
+    ".gitbook/includes/note.md": "Shared note.\n",
+}
+
+
+def write_pages(folder):
+    for name, content in PAGES.items():
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+
+@needs_pandoc
+def test_batched_run_matches_one_run_per_document(tmp_path):
+    write_pages(tmp_path)
+    batch = [(tmp_path / name, (tmp_path / name).read_text(encoding="utf-8"))
+             for name in ("guide/setup.md", "guide/usage.md", "README.md")]
+
+    batched = conv.convert_batch(batch)
+
+    assert batched == [conv.run_pandoc(content, md_file) for md_file, content in batch]
+    # The Lua filter drops each document's first block, its title, in both modes
+    assert all("<h1" not in part for part in batched)
+
+
+@needs_pandoc
+def test_snippets_are_not_converted_as_pages(tmp_path):
+    source, output = tmp_path / "docs", tmp_path / "out"
+    write_pages(source)
+
+    conv.convert_gitbook_to_fluid(str(source), str(output), batch_size=2)
+
+    converted = sorted(path.relative_to(output).as_posix() for path in output.rglob("*.md"))
+    assert converted == ["README.md", "guide/setup.md", "guide/usage.md"]
+    assert "Shared note." in (output / "README.md").read_text(encoding="utf-8")
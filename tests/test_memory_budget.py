@@ -0,0 +1,89 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import memory_budget
+from memory_budget import MIN_BYTES_PER_SOURCE_BYTE, MemoryBudget, PeakMemory, map_within_budget
+
+MAIN_RSS = 1000
+
+
+@pytest.fixture
+def fixed_rss(monkeypatch):
+    monkeypatch.setattr(memory_budget, 'current_rss', lambda: MAIN_RSS)
+
+
+class Pages:
+    """
+    Stands in for the page converter: reports a working memory of ratio bytes per
+    source byte and records how many pages ran at once.
+    """
+
+    def __init__(self, ratio=MIN_BYTES_PER_SOURCE_BYTE):
+        self.ratio = ratio
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def convert(self, name, source_bytes):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return {'name': name, 'source_bytes': source_bytes, 'base_bytes': 0,
+                'peak_bytes': source_bytes * self.ratio}
+
+
+def run(budget, pages, sizes):
+    tasks = [((name, size), size) for name, size in sizes.items()]
+    with ThreadPoolExecutor(max_workers=budget.workers) as executor:
+        return [report['name'] for report in map_within_budget(executor, pages.convert, tasks, budget)]
+
+
+def test_pages_in_flight_stay_within_the_budget(fixed_rss):
+    page_bytes = 100 * MIN_BYTES_PER_SOURCE_BYTE
+    budget = MemoryBudget(MAIN_RSS + 2 * page_bytes, workers=4)
+    pages = Pages()
+
+    done = run(budget, pages, {f'page{index}': 100 for index in range(8)})
+
+    assert sorted(done) == [f'page{index}' for index in range(8)]
+    assert pages.most_running == 2
+    assert budget.peak_estimate <= budget.budget_bytes
+    assert budget.in_flight == 0
+
+
+def test_a_page_over_the_budget_runs_alone(fixed_rss):
+    budget = MemoryBudget(MAIN_RSS + 100 * MIN_BYTES_PER_SOURCE_BYTE, workers=4)
+    pages = Pages()
+
+    done = run(budget, pages, {'huge': 10000, 'small': 10})
+
+    assert done == ['huge', 'small']
+    assert pages.most_running == 1
+
+
+def test_estimates_learn_from_measured_pages(fixed_rss):
+    budget = MemoryBudget(10**9, workers=2)
+
+    budget.release(0, {'source_bytes': 10, 'base_bytes': 500, 'peak_bytes': 500 + 10 * 200})
+
+    assert budget.estimate(3) == 3 * 200
+    assert budget.committed() == MAIN_RSS + 2 * 500
+
+
+def test_peak_memory_covers_the_block():
+    with PeakMemory() as peak:
+        data = bytearray(64 * 2**20)
+        # Touch every memory page, so that all of them are resident
+        data[::4096] = b'x' * len(data[::4096])
+    del data
+
+    assert peak.peak_bytes - peak.base_bytes >= 32 * 2**20
@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import RunMetrics
+
+
+def make_metrics():
+    metrics = RunMetrics()
+    metrics.inc('pages_converted', 3)
+    metrics.inc('pages_converted')
+    metrics.set('archive_bytes', 250)
+    metrics.set('archive_uncompressed_bytes', 1000)
+    metrics.set('upload_bytes', 250)
+    metrics.set('upload_seconds', 0.5)
+    metrics.inc('cache_hits', 3)
+    metrics.inc('cache_misses', 1)
+    metrics.set('pages_by_path', {'fast': 3, 'full': 1})
+    metrics.set_stage_seconds('convert', 1.23456)
+    metrics.finish(True)
+    return metrics
+
+
+def test_finish_derives_ratios():
+    data = make_metrics().to_dict()
+
+    assert data['run_success'] == 1
+    assert data['pages_converted'] == 4
+    assert data['compression_ratio'] == 4.0
+    assert data['upload_bytes_per_second'] == 500.0
+    assert data['cache_hit_ratio'] == 0.75
+    assert data['stage_duration_seconds'] == {'convert': 1.235}
+
+
+def test_unknown_names_are_not_exported():
+    metrics = RunMetrics()
+    metrics.set('not_a_metric', 1)
+    metrics.finish(False)
+
+    assert 'not_a_metric' not in metrics.to_dict()
+    assert metrics.to_dict()['run_success'] == 0
+
+
+def test_write_json_and_prometheus(tmp_path):
+    json_path, prometheus_path = make_metrics().write(str(tmp_path / 'run_metrics'))
+
+    with open(json_path, 'r', encoding='utf-8') as file:
+        assert json.load(file)['pages_by_path'] == {'fast': 3, 'full': 1}
+    with open(prometheus_path, 'r', encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert '# TYPE gitbook_ft_pages_converted gauge' in lines
+    assert 'gitbook_ft_pages_converted 4' in lines
+    assert 'gitbook_ft_pages_by_path{path="fast"} 3' in lines
+    assert 'gitbook_ft_stage_duration_seconds{stage="convert"} 1.235' in lines
+    samples = [line for line in lines if not line.startswith('#')]
+    assert all(len(line.split(' ')) == 2 for line in samples)
+    assert sorted(os.listdir(tmp_path)) == ['run_metrics.json', 'run_metrics.prom']
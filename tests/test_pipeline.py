@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import PipelineAborted, PipelineScheduler
+
+
+def test_stages_run_after_their_dependencies_and_get_their_results():
+    order = []
+    lock = threading.Lock()
+
+    def stage(name, value):
+        def run(stage, results):
+            with lock:
+                order.append(name)
+            return value(results)
+        return run
+
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('a', stage('a', lambda results: 1))
+    scheduler.add_stage('b', stage('b', lambda results: results['a'] + 1), deps=['a'])
+    scheduler.add_stage('c', stage('c', lambda results: results['a'] * 10), deps=['a'])
+    scheduler.add_stage('d', stage('d', lambda results: (results['b'], results['c'])), deps=['b', 'c'])
+
+    assert scheduler.run() == {'a': 1, 'b': 2, 'c': 10, 'd': (2, 10)}
+    assert order[0] == 'a' and order[-1] == 'd'
+    assert scheduler.report()['critical_path'][0] == 'a'
+
+
+def test_channel_streams_items_to_the_consumer():
+    def produce(stage, results):
+        for item in range(200):
+            stage.outputs['items'].put(item)
+        stage.outputs['items'].close()
+
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('produce', produce)
+    scheduler.add_stage('consume', lambda stage, results: sum(stage.inputs['items']))
+    scheduler.add_channel('items', producer='produce', consumer='consume', maxsize=4)
+
+    assert scheduler.run()['consume'] == sum(range(200))
+    assert scheduler.report()['critical_path'] == ['produce', 'consume']
+
+
+def test_a_failure_aborts_the_other_stages_and_is_raised():
+    ran = []
+
+    def fail(stage, results):
+        raise ValueError("conversion failed")
+
+    def consume(stage, results):
+        # Blocks until the failure aborts the pipeline: the producer never closes
+        for _ in stage.inputs['items']:
+            pass
+
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('produce', fail)
+    scheduler.add_stage('consume', consume)
+    scheduler.add_channel('items', producer='produce', consumer='consume')
+    scheduler.add_stage('upload', lambda stage, results: ran.append('upload'), deps=['consume'])
+
+    with pytest.raises(ValueError, match='conversion failed'):
+        scheduler.run()
+
+    assert ran == []
+    assert isinstance(scheduler.stages['consume'].error, PipelineAborted)
+    assert isinstance(scheduler.stages['upload'].error, PipelineAborted)
+    assert scheduler.report()['stages']['produce']['failed']
+
+
+def test_unknown_and_duplicate_stages_are_rejected():
+    scheduler = PipelineScheduler()
+    scheduler.add_stage('a', lambda stage, results: None)
+
+    with pytest.raises(ValueError, match='Duplicate stage'):
+        scheduler.add_stage('a', lambda stage, results: None)
+    with pytest.raises(ValueError, match='unknown stage'):
+        scheduler.add_stage('b', lambda stage, results: None, deps=['missing'])
@@ -0,0 +1,55 @@
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reachability import package_reachable, reachable_files, resolve
+
+FILES = {
+    'SUMMARY.md': '# Summary\n\n* [Home](README.md)\n* [Guide](guide/)\n',
+    'README.md': '# Home\n\n![Logo](images/logo.png)\n',
+    'guide/README.md': '# Guide\n\n<img src="../images/diagram.png">\n',
+    'orphan.md': '# Orphan\n\n![Unused](images/unused.png)\n',
+    'images/logo.png': 'logo',
+    'images/diagram.png': 'diagram',
+    'images/unused.png': 'unused',
+}
+
+
+def write_files(folder):
+    for name, content in FILES.items():
+        path = folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+
+
+def test_unreachable_pages_and_images_are_excluded(tmp_path):
+    write_files(tmp_path)
+
+    kept, excluded = reachable_files([('', str(tmp_path))], 'SUMMARY.md')
+
+    assert [name for name, _ in kept] == ['README.md', 'SUMMARY.md', 'guide/README.md', 'images/diagram.png',
+                                          'images/logo.png']
+    assert excluded == [('images/unused.png', len(FILES['images/unused.png'])), ('orphan.md', len(FILES['orphan.md']))]
+
+
+def test_package_holds_only_reachable_files(tmp_path):
+    folder = tmp_path / 'docs'
+    write_files(folder)
+    zip_path = tmp_path / 'docs.zip'
+
+    package_reachable([('', str(folder))], 'SUMMARY.md', str(zip_path))
+
+    with zipfile.ZipFile(zip_path) as archive:
+        names = archive.namelist()
+    assert 'images/logo.png' in names and 'images/diagram.png' in names
+    assert 'images/unused.png' not in names and 'orphan.md' not in names
+
+
+def test_resolve_follows_readmes_and_converted_pages():
+    files = {'README.html', 'guide/_README.md', 'guide/setup.html'}
+
+    assert resolve(files, 'README.html', 'guide') == 'guide/_README.md'
+    assert resolve(files, 'guide/_README.md', 'setup.md') == 'guide/setup.html'
+    assert resolve(files, 'guide/setup.html', '../') == 'README.html'
+    assert resolve(files, 'README.html', '../README.html') is None
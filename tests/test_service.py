@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service import ConversionService, ServiceHandler
+
+PAGES = {
+    'SUMMARY.md': '# Summary\n\n* [Home](README.md)\n* [Guide](guide.md)\n',
+    'README.md': '# Home\n\nWelcome.\n',
+    'guide.md': '# Guide\n\nSee [home](README.md).\n',
+}
+
+
+def write_repo(folder):
+    folder.mkdir(parents=True)
+    for name, content in PAGES.items():
+        (folder / name).write_text(content, encoding='utf-8')
+    return folder
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    root = tmp_path_factory.mktemp('service')
+    write_repo(root / 'repos' / 'docs')
+    service = ConversionService(workers=1, max_finished_jobs=2, work_root=str(root / 'work'),
+                                repo_root=str(root / 'repos'))
+    ServiceHandler.service = service
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ServiceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service.url = f"http://127.0.0.1:{server.server_address[1]}"
+    service.root = root
+    yield service
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def request(service, path, body=None, content_type='application/json'):
+    data = json.dumps(body).encode('utf-8') if isinstance(body, dict) else body
+    req = urllib.request.Request(service.url + path, data=data, headers={'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def wait_for(service, job_id):
+    for _ in range(300):
+        status, body = request(service, f'/jobs/{job_id}')
+        job = json.loads(body)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_submit_poll_and_fetch_a_folder_job(service):
+    status, body = request(service, '/jobs', {'repo_path': 'docs', 'title': 'Docs'})
+    assert status == 202
+    job = wait_for(service, json.loads(body)['id'])
+    assert job['status'] == 'done' and job['pages'] == 3
+
+    status, body = request(service, f"/jobs/{job['id']}/result")
+
+    assert status == 200
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert {'README.html', 'guide.html'} <= set(archive.namelist())
+
+
+def test_tarball_job_returns_the_ftmap(service, tmp_path):
+    repo = write_repo(tmp_path / 'docs')
+    tarball = io.BytesIO()
+    with tarfile.open(fileobj=tarball, mode='w:gz') as archive:
+        archive.add(repo, arcname='docs')
+
+    status, body = request(service, '/jobs?title=Docs&result=ftmap', tarball.getvalue(), 'application/gzip')
+    job = wait_for(service, json.loads(body)['id'])
+    status, body = request(service, f"/jobs/{job['id']}/result")
+
+    assert status == 200 and b'ft:map' in body
+
+
+@pytest.mark.parametrize('repo_path', ['../work', '/etc', 'docs/../../repos/../..'])
+def test_folders_outside_the_repo_root_are_refused(service, repo_path):
+    status, body = request(service, '/jobs', {'repo_path': repo_path, 'title': 'Docs'})
+
+    assert status == 403 and 'inside' in json.loads(body)['error']
+
+
+def test_folders_are_refused_without_a_repo_root():
+    with pytest.raises(PermissionError, match='--repo-root'):
+        ConversionService.repo_folder(SimpleNamespace(repo_root=None), 'docs')
+
+
+def test_finished_jobs_are_evicted_and_metrics_reported(service):
+    ids = []
+    for _ in range(3):
+        _, body = request(service, '/jobs', {'repo_path': 'docs', 'title': 'Docs'})
+        ids.append(wait_for(service, json.loads(body)['id'])['id'])
+
+    assert request(service, f'/jobs/{ids[0]}')[0] == 404
+    assert not os.path.exists(service.root / 'work' / ids[0])
+    assert len(service.finished_ids) == 2
+    metrics = json.loads(request(service, '/metrics')[1])
+    assert metrics['running'] == 0 and metrics['queue_depth'] == 0
+    assert metrics['latency_seconds']['count'] >= 3
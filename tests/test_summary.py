@@ -0,0 +1,49 @@
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "md2ftml"))
+import summary
+
+SUMMARY_LINES = [
+    "# Table of contents\n",
+    "\n",
+    "* [Introduction](README.md)\n",
+    "* [Say \"hello\" & <goodbye>](guide/README.md)\n",
+    "  * [It's 'quoted'](guide/quoted.md)\n",
+    "    * [Ünïcödé > ASCII](guide/unicode.md)\n",
+    "* [Plain](plain.md)\n",
+]
+
+
+def make_tree():
+    tree = summary.convert_to_xml(SUMMARY_LINES, 'Title with "quotes" & more')
+    summary.add_metadata(tree, {
+        "guide/README.md": {"lastModified": "2024-01-01", "contributors": ['A "nick" <a@b.c>', "B & C"]},
+        "plain.md": {"note": ""},
+    })
+    return tree
+
+
+def test_pretty_print_matches_expected_output():
+    # The layout of minidom's toprettyxml, which wrote the ftmap before pretty_print_xml
+    with open(os.path.join(TESTS_DIR, "data", "summary.ftmap"), "r", encoding="utf-8") as file:
+        expected = file.read()
+
+    assert summary.pretty_print_xml(make_tree()) == expected
+
+
+def content(root):
+    # Parsing qualifies the ft: names and takes in the namespace declarations, so only
+    # the other attribute values are compared; indentation is not text
+    return [([value for key, value in element.attrib.items() if not key.startswith("xmlns")],
+             (element.text or "").strip()) for element in root.iter()]
+
+
+def test_pretty_print_round_trips():
+    tree = make_tree()
+
+    parsed = ET.fromstring(summary.pretty_print_xml(tree))
+
+    assert content(parsed) == content(tree.getroot())
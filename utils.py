@@ -1,11 +1,28 @@
 import os
-import shutil
+import tempfile
 from dotenv import load_dotenv
 
-def create_zip_archive(folder_path):
-    zip_name = os.path.basename(folder_path)
-    shutil.make_archive(base_name=zip_name, format='zip', root_dir=folder_path)
-    return f"{zip_name}.zip"
+def zip_archive_path(folder_path):
+    return f"{os.path.basename(os.path.normpath(folder_path))}.zip"
+
+def write_atomic(path, content, suffix=''):
+    """
+    Writes content to a temporary file next to path, then renames it over path, so
+    that path only ever holds a complete file. The temporary name starts with a dot
+    and ends with suffix.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=suffix)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        # mkstemp creates the file owner-only; scrapers and uploads usually run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def load_config():
     load_dotenv()  # This loads the variables from .env file
@@ -14,10 +31,32 @@ def load_config():
         'gitbook_repo': os.getenv('GITBOOK_REPO_URL'),
         'gitbook_repo_folder': os.getenv('GITBOOK_REPO_FOLDER'),
         'commit_hash': os.getenv('COMMIT_HASH'),
+        'memory_budget_mb': int(os.getenv('MEMORY_BUDGET_MB', '0')) or None,
+        'metrics_file': os.getenv('METRICS_FILE', 'run_metrics'),
+        'link_report': os.getenv('LINK_REPORT', 'link_report.json'),
+        # Journal of converted pages, for --resume (default: <folder>.journal)
+        'journal_file': os.getenv('JOURNAL_FILE'),
+        # Split the output into archives of at most this many MB of content, each uploaded as a
+        # publication of its own (0: one archive, one publication)
+        'archive_max_mb': float(os.getenv('ARCHIVE_MAX_MB', '0')) or None,
+        # Only package what the FTMAP reaches through page links and images
+        'prune_unreachable': os.getenv('PRUNE_UNREACHABLE', '1') != '0',
+        # Write pages through the minifying serializer
+        'minify_html': os.getenv('MINIFY_HTML', '0') == '1',
+        # 'fail' stops the run before the upload when a link is broken, 'warn' only reports
+        'broken_links': os.getenv('BROKEN_LINKS', 'fail'),
+        # Profiling a single page also turns profiling on
+        'profile_dir': os.getenv('PROFILE_DIR') or ('profiles' if os.getenv('PROFILE_PAGE') else None),
+        'profile_page': os.getenv('PROFILE_PAGE'),
         'fluid_topics': {
             'api_key': os.getenv('FLUID_TOPICS_API_KEY'),
             'base_url': os.getenv('FLUID_TOPICS_BASE_URL'),
             'source_id': os.getenv('FLUID_TOPICS_SOURCE_ID'),
-            'publication_title': os.getenv('PUBLICATION_TITLE')
+            'publication_title': os.getenv('PUBLICATION_TITLE'),
+            'upload_connections': int(os.getenv('UPLOAD_CONNECTIONS', '4')),
+            # Retries only follow failures after which the archive was certainly not accepted
+            'upload_retries': int(os.getenv('UPLOAD_RETRIES', '0')),
+            # Seconds to wait for Fluid Topics to answer once the archive is sent
+            'upload_timeout': float(os.getenv('UPLOAD_TIMEOUT', '600'))
         }
     }
\ No newline at end of file
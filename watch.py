@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import errno
+import select
+import shutil
+import struct
+import logging
+import argparse
+import ctypes
+import ctypes.util
+from html_converter import HTMLConverter
+from ftmap_generator import FTMapGenerator
+from utils import load_config
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+IGNORED_DIRS = {'.git'}
+
+
+class InotifyWatcher:
+    """
+    Watches a folder tree with Linux inotify, through libc so that no extra
+    dependency is needed.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self._watch_tree(folder)
+
+    def _watch_tree(self, folder):
+        for root, dirs, _ in os.walk(folder):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {root}")
+            self.watches[wd] = root
+
+    def poll(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns the set of changed paths, or None
+        if the kernel dropped events and everything must be considered changed.
+        """
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        while readable:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if wd not in self.watches:
+                    continue
+                path = os.path.join(self.watches[wd], os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if os.path.basename(path) in IGNORED_DIRS:
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                        # Files can land in a new folder before its watch exists
+                        self._watch_tree(path)
+                        for root, _, files in os.walk(path):
+                            changed.update(os.path.join(root, file) for file in files)
+                    continue
+                if name:
+                    changed.add(path)
+            readable, _, _ = select.select([self.fd], [], [], 0)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Fallback watcher that compares file modification times between polls.
+    """
+
+    def __init__(self, folder, interval=0.5):
+        self.folder = folder
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root, dirs, files in os.walk(self.folder):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path) != self.snapshot.get(path)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder, polling=False, interval=0.5):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available ({e}), falling back to polling")
+    return PollingWatcher(folder, interval)
+
+
+class PreviewBuilder:
+    """
+    Keeps a converted copy of a GitBook folder up to date. Sources are never modified:
+    pages are written to output_folder, and only changed pages are reconverted.
+    """
+
+    def __init__(self, source_folder, output_folder, title):
+        self.source_folder = os.path.abspath(source_folder)
+        self.output_folder = os.path.abspath(output_folder)
+        self.title = title
+        self.html_converter = HTMLConverter(self.source_folder)
+        self.summary_md = os.path.join(self.source_folder, 'SUMMARY.md')
+
+    def output_path(self, source_path):
+        relative_path = os.path.relpath(source_path, self.source_folder)
+        if relative_path.endswith('.md'):
+            relative_path = os.path.splitext(relative_path)[0] + '.html'
+        return os.path.join(self.output_folder, relative_path)
+
+    def build_all(self):
+        changed = set()
+        for root, dirs, files in os.walk(self.source_folder):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            changed.update(os.path.join(root, file) for file in files)
+        return self.rebuild(changed)
+
+    def rebuild(self, changed):
+        pages = 0
+        summary_changed = False
+        for path in sorted(changed):
+            if path.startswith(self.output_folder + os.sep):
+                continue
+            target = self.output_path(path)
+            if not os.path.exists(path):
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if path.endswith('.md'):
+                try:
+                    self.html_converter.convert_file(path, target, remove_source=False)
+                except Exception as e:
+                    logger.error(f"Failed to convert {path}: {e}")
+                    continue
+                pages += 1
+                summary_changed = summary_changed or path == self.summary_md
+            else:
+                shutil.copy2(path, target)
+
+        if summary_changed:
+            FTMapGenerator(self.output_folder, title=self.title).generate()
+        return pages, summary_changed
+
+
+def watch(source_folder, output_folder, title, polling=False, interval=0.5, debounce=0.05):
+    builder = PreviewBuilder(source_folder, output_folder, title)
+    start = time.perf_counter()
+    pages, _ = builder.build_all()
+    logger.info(f"Initial build: {pages} pages in {time.perf_counter() - start:.2f}s, output in {output_folder}")
+
+    watcher = create_watcher(builder.source_folder, polling, interval)
+    logger.info(f"Watching {source_folder} with {type(watcher).__name__}, press Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.poll(1.0)
+            if changed is not None and not changed:
+                continue
+            # Editors often write a file in several steps; let the burst settle
+            while True:
+                more = watcher.poll(debounce)
+                if more is None or changed is None:
+                    changed = None
+                    break
+                if not more:
+                    break
+                changed |= more
+
+            start = time.perf_counter()
+            if changed is None:
+                pages, summary_changed = builder.build_all()
+            else:
+                pages, summary_changed = builder.rebuild(changed)
+            ftmap_note = ", FTMAP regenerated" if summary_changed else ""
+            logger.info(f"Rebuilt {pages} pages in {time.perf_counter() - start:.3f}s{ftmap_note}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Rebuild a Fluid Topics preview whenever the GitBook folder changes.")
+    parser.add_argument('--folder', default=config['gitbook_repo_folder'], help="GitBook folder to watch")
+    parser.add_argument('--output', help="Preview output folder (default: <folder>_preview)")
+    parser.add_argument('--title', default=config['fluid_topics']['publication_title'], help="Publication title")
+    parser.add_argument('--polling', action='store_true', help="Poll for changes instead of using inotify")
+    parser.add_argument('--interval', type=float, default=0.5, help="Polling interval in seconds")
+    args = parser.parse_args()
+
+    if not args.folder:
+        parser.error("Set GITBOOK_REPO_FOLDER or pass --folder")
+    if not args.title:
+        parser.error("Set PUBLICATION_TITLE or pass --title")
+    output_folder = args.output or f"{os.path.normpath(args.folder)}_preview"
+    watch(args.folder, output_folder, args.title, args.polling, args.interval)
+
+
+if __name__ == "__main__":
+    main()